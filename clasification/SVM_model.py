@@ -112,6 +112,17 @@ class SVM_Classifier:
         with open(self.svm_path, 'wb') as f:
             pickle.dump(model, f)
 
+    def preprocess(self, sentence: str) -> str:
+        """
+        Simple preprocess of sentence before embedding.
+        :param sentence: string
+        :return: string
+        """
+        sentence = sentence.lower()
+        sentence = re.sub(r'\d+', '', sentence)  # numbers
+        sentence = re.sub(r'\p{P}+', '', sentence)  # punc
+        return sentence
+
     def eval_example(self, sentence: str):
         """
         Evaluate sentence with irrelevant classifier based on SVM with uSIF embeddings
@@ -119,9 +130,7 @@ class SVM_Classifier:
         :return: string representing a label
         """
         # simple preprocess of sentence
-        sentence = sentence.lower()
-        sentence = re.sub(r'\d+', '', sentence)  # numbers
-        sentence = re.sub(r'\p{P}+', '', sentence)  # punc
+        sentence = self.preprocess(sentence)
         # transfer sentence
         features = self.usif_model.infer([(sentence.split(), 0)])
         # predict label
@@ -131,6 +140,21 @@ class SVM_Classifier:
         else:
             return 'normal'
 
+    def eval_examples(self, sentences: list) -> list:
+        """
+        Evaluate list of sentences with one embedding and prediction call.
+        :param sentences: list of strings
+        :return: list of strings representing labels
+        """
+        if not sentences:
+            return []
+        # transfer sentences
+        data_embed = [(self.preprocess(sentence).split(), i) for i, sentence in enumerate(sentences)]
+        features = self.usif_model.infer(data_embed)
+        # predict labels
+        y_pred = self.model.predict(features)
+        return ['irrelevant' if y == '0' else 'normal' for y in y_pred]
+
 
 def main():
     parser = argparse.ArgumentParser(
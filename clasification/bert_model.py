@@ -51,6 +51,39 @@ class Bert_model:
         else:
             return preds.view().item()
 
+    def eval_examples(self, examples, useLabels=True, batch_size=32):
+        """
+        Evaluate list of sentence pairs (sentence_a, sentence_b) as in eval_example, sentences are evaluated in padded
+        mini-batches. Examples are sorted by length, so padding of batch is cut to its longest sequence.
+        :param examples: list of tuples (sentence_a, sentence_b)
+        :param useLabels: in regression task, we want models estimate.
+        :param batch_size: count of examples in one forward pass of model
+        :return: list of predictions in order of examples
+        """
+        order = sorted(range(len(examples)), key=lambda i: len(examples[i][0]) + len(examples[i][1]))
+        preds = [None] * len(examples)
+
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            input_examples = [InputExample(guid=i, text_a=examples[i][0], text_b=examples[i][1], label=None)
+                              for i in batch]
+            inputs, _, _ = convert_to_features(input_examples, self.tokenizer, batch_size=len(batch))
+            # cut padding to the longest sequence of batch
+            length = int(inputs['attention_mask'].sum(dim=1).max())
+            inputs = {key: value[:, :length] for key, value in inputs.items()}
+            with torch.no_grad():
+                ouputs = self.model(**inputs)
+            logits = ouputs[:2][0].detach().cpu().numpy()
+
+            if useLabels:
+                batch_preds = [self.labels[p] for p in np.argmax(logits, axis=1)]
+            else:
+                batch_preds = logits.reshape(-1).tolist()
+            for i, pred in zip(batch, batch_preds):
+                preds[i] = pred
+
+        return preds
+
     def get_embedding(self, sentence, strategy=None):
         """
         Get sentence embedding from last hidden state.
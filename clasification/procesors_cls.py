@@ -354,7 +354,7 @@ def convert_to_features(examples,tokenizer,cls_token_at_end=False,max_seq_length
                                  cls_token='[CLS]', sep_token='[SEP]', pad_token=0,
                                  sequence_a_segment_id=0, sequence_b_segment_id=1,
                                  cls_token_segment_id=1, pad_token_segment_id=0,
-                                 mask_padding_with_zero=True):
+                                 mask_padding_with_zero=True, batch_size=8):
     features = []
     for (ex_index, example) in enumerate(examples):
         tokens_a = tokenizer.tokenize(example.text_a)
@@ -415,7 +415,7 @@ def convert_to_features(examples,tokenizer,cls_token_at_end=False,max_seq_length
     all_input_mask = torch.tensor([f.input_mask for f in features], dtype=torch.long)
     all_segment_ids = torch.tensor([f.segment_ids for f in features], dtype=torch.long)
     dataset = TensorDataset(all_input_ids, all_input_mask, all_segment_ids)
-    eval_dataloader = DataLoader(dataset,batch_size=8)
+    eval_dataloader = DataLoader(dataset,batch_size=batch_size)
     for batch in eval_dataloader:
         batch = tuple(t.to("cpu") for t in batch)
         inputs = {'input_ids':      batch[0],
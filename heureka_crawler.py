@@ -1,22 +1,37 @@
 """
 This file contains implementation of the HeurekaCrawler class. Class works deeply with elasticsearch, to which it indexes
-reviews. Class implements heureka reviews crawl from txts of crawled products, actualization of reviews by crawling all
-new reviews from subcategories, shop reviews crawling and repair of products reviews with minimal review count. Class
-can use models for irrelevant review filtering (HeurekaFilter) and text rating model (HeurekaRating).
+reviews. Class implements heureka reviews crawl from txts of crawled products (or directly from products discovered by
+HeurekaIndex), actualization of reviews by crawling all new reviews from subcategories, shop reviews crawling and repair
+of products reviews with minimal review count. Class can use models for irrelevant review filtering (HeurekaFilter) and text rating model (HeurekaRating).
 
 Author: xkloco00@stud.fit.vutbr.cz
 """
 
-import time, sys, argparse, re
+import time, sys, argparse, re, os, threading, queue
+import multiprocessing as mp
+from itertools import islice
 from datetime import datetime
-from urllib.request import urlopen
 from bs4 import BeautifulSoup
 from datetime import date
-from utils.elastic_connector import Connector
+from utils.elastic_connector import Connector, CREATED, FAILED
+from utils.extractor import parse_html, extract_product, extract_reviews, extract_next_page, extract_breadcrumbs, \
+    extract_shop_reviews, extract_shop_next_page
+from utils.fetcher import Fetcher, batches
+from utils.rate_limiter import RateLimiter
+from utils.http_session import HttpSession
+from utils.http_cache import HttpCache, NOT_MODIFIED
+from utils.page_archive import PageArchive, RecordingSession, ReplaySession
+from utils.pipeline import Pipeline, Stage
+from utils.review_index import ReviewIndex, review_id
+from utils.checkpoint import Checkpoint
+from utils.frontier import Frontier
+from utils.url_store import UrlStore
+from utils.metrics import Metrics
 from utils.discussion import Review, Product, Aspect, AspectCategory
 from utils.morpho_tagger import MorphoTagger
 from heureka_models.heureka_filter import HeurekaFilter
 from heureka_models.heureka_rating import HeurekaRating
+from heureka_index import HeurekaIndex
 
 
 class HeurekaCrawler:
@@ -25,7 +40,8 @@ class HeurekaCrawler:
     and reviews. Class is strongly connected to elastic search client to which it indexes new reviews.
     """
     def __init__(self, connector: Connector, tagger: MorphoTagger, filter_model: HeurekaFilter,
-                 rating_model: HeurekaRating):
+                 rating_model: HeurekaRating, fetcher: Fetcher = None, review_index: ReviewIndex = None,
+                 http_cache: HttpCache = None, url_store: UrlStore = None, heureka_index: HeurekaIndex = None):
         """
         Constructor initializes domain categories with all available models for classification and pos tagging, sets
         statistics counter.
@@ -33,6 +49,11 @@ class HeurekaCrawler:
         :param tagger: POS tagging model
         :param filter_model: SVM filtering model
         :param rating_model: Bert regression model
+        :param fetcher: concurrent page downloader
+        :param review_index: local index of existing reviews, that is consulted before elastic
+        :param http_cache: cache of validators of listing pages for conditional requests during actualization
+        :param url_store: store of product urls of HeurekaIndex, which is read instead of url files
+        :param heureka_index: HeurekaIndex with product queue, which discovers products for fused crawling
         """
         self.categories = [
             'Elektronika',
@@ -54,6 +75,17 @@ class HeurekaCrawler:
         self.tagger = tagger
         self.filter_model = filter_model
         self.rating_model = rating_model
+        self.fetcher = fetcher if fetcher else Fetcher()
+        self.review_index = review_index
+        self.http_cache = http_cache
+        self.url_store = url_store
+        self.heureka_index = heureka_index
+        # category lists of products are loaded by the first actualization
+        self.category_cache_warm = False
+        # registry of metrics is shared with fetcher
+        self.metrics = self.fetcher.metrics
+        # count of pages, that are downloaded concurrently in one batch
+        self.batch_size = 4 * self.fetcher.max_concurrency
 
         self.total_review_count = 0
         self.total_products_count = 0
@@ -62,126 +94,213 @@ class HeurekaCrawler:
         self.total_empty_reviews = 0
         self.irrelevant_sentences_count = 0
         self.sentences_count = 0
+        # statistics of buffered documents, that were not indexed, they are subtracted after flush of bulk
+        self.unindexed = {'total_review_count': 0, 'total_product_new_count': 0, 'total_review_new_count': 0}
+        self.statistic_lock = threading.Lock()
 
-    def parse_product_page(self, infile, product: Product, category_domain):
+    def parse_html(self, content: bytes):
         """
-        Parse review page of product, build up product object by appending new reviews.
+        Parse downloaded page, time of parsing is measured.
+        :param content: content of page
+        :return: root element of lxml tree
+        """
+        with self.metrics.timer('parse'):
+            return parse_html(content)
 
-        :param infile:
-        :param product:
-        :param category_domain:
+    def pos_tagging(self, text: str):
+        """
+        POS tag text with tagger, time of tagging is measured.
+        :param text:
+        :return: list of tagged sentences
+        """
+        with self.metrics.timer('tagging'):
+            return self.tagger.pos_tagging(text)
+
+    def flush_bulk(self, refresh: bool = True):
+        """
+        Index buffered documents, time of indexing is measured.
+        :param refresh: refresh indexes after indexing
+        :return: counts of documents, that were subtracted from statistics
+        """
+        with self.metrics.timer('index'):
+            self.connector.flush_bulk(refresh=refresh)
+
+        # outcomes of all buffered documents are known
+        with self.statistic_lock:
+            discounted = dict(self.unindexed)
+            for key, value in self.unindexed.items():
+                setattr(self, key, getattr(self, key) - value)
+                self.unindexed[key] = 0
+        return discounted
+
+    def discount_statistic(self, **counts):
+        """
+        Record documents, that were counted in statistics but not indexed (failed or duplicate), method is thread
+        safe. Statistics are decreased with the next flush_bulk.
+        :param counts: names of statistics counters with counts
         :return:
         """
+        with self.statistic_lock:
+            for key, value in counts.items():
+                self.unindexed[key] += value
 
-        def _task_product_page(product_page_xml):
-            review_list = product_page_xml.find(class_="product-review-list")
-            # if True then we parsed all product reviews, else we need to go on
-            if self.parse_product_revs(review_list, product, category_domain):
-                return
+    def review_exists(self, category_domain: str, product_name: str, author: str, date_str: str) -> bool:
+        """
+        Check if product review already exists, local review index is consulted before elastic.
+        :param category_domain: name of category domain or its index
+        :param product_name: name of product
+        :param author: the name of author
+        :param date_str: string representation of date
+        :return:
+        """
+        with self.metrics.timer('dedup'):
+            if self.review_index:
+                try:
+                    index = self.connector.domain.get(category_domain, category_domain)
+                    return self.review_index.contains(index, product_name, author, date_str)
+                except Exception as e:
+                    print("[review_exists] Error: " + str(e), file=sys.stderr)
 
-            # find section with new page
-            references = review_list.find(class_="pag bot").find("a", "next").references.get('href')
-            if references:
-                return references.get('href')
-            else:
-                return None
+            return bool(self.connector.get_review_by_product_author_timestr(category_domain, product_name, author,
+                                                                            date_str))
 
-        try:
-            ref = _task_product_page(infile)
+    def shop_review_exists(self, shop_name: str, author: str, date: str) -> bool:
+        """
+        Check if shop review already exists, local review index is consulted before elastic.
+        :param shop_name: the name of the shop
+        :param author: the name of the author
+        :param date: date in iso format
+        :return:
+        """
+        with self.metrics.timer('dedup'):
+            if self.review_index:
+                try:
+                    return self.review_index.contains('shop_review', shop_name, author, date)
+                except Exception as e:
+                    print("[shop_review_exists] Error: " + str(e), file=sys.stderr)
 
-            # loop over footer with references to next pages
-            while ref:
+            return bool(self.connector.get_review_by_shop_author_timestr(shop_name, author, date))
+
+    def review_indexed(self, index: str, *parts):
+        """
+        Get callback of bulk item of review, which adds review to local review index, if review is in elastic (created
+        or duplicate). Failed review is not added, so it is indexed again by the next crawl.
+        :param index: name of category domain or its index
+        :param parts: values identifying review
+        :return: function of outcome of bulk item
+        """
+        def _outcome(outcome: str):
+            if self.review_index and outcome != FAILED:
                 try:
-                    infile = BeautifulSoup(urlopen(product.get_url() + ref), "lxml")
+                    self.review_index.add(self.connector.domain.get(index, index), *parts)
+                except Exception as e:
+                    print("[review_indexed] Error: " + str(e), file=sys.stderr)
+        return _outcome
+
+    def parse_product_page(self, page: dict, product: Product, category_domain):
+        """
+        Parse review page of product, build up product object by appending new reviews.
+
+        :param page: record of product page (extract_product)
+        :param product:
+        :param category_domain:
+        :return:
+        """
+        try:
+            # if True then we parsed all product reviews, else we need to go on
+            while not self.parse_product_revs(page['reviews'], product, category_domain):
+                ref = page['next_page']
+                if not ref:
+                    break
+                # loop over footer with references to next pages
+                try:
+                    page = extract_product(self.parse_html(self.fetcher.fetch(product.get_url() + ref)))
                 except IOError:
                     print("[parse_product_page] Cant open " + product.get_url() + ref, file=sys.stderr)
-
-                ref = _task_product_page(infile)
+                    break
 
         except Exception as e:
-            print("[parse_product_page] Exception: " + product.get_url())
+            print("[parse_product_page] Exception: " + product.get_url() + " " + str(e), file=sys.stderr)
 
-    def parse_review(self, rev) -> Review:
+    def filter_sentences(self, reviews: list):
+        """
+        Remove irrelevant sentences from review records of page, all sentences are evaluated with filter model at
+        once. Irrelevant summary is replaced with empty string.
+        :param reviews: list of review records (extract_review, extract_shop_reviews)
+        :return:
         """
-        Create review object from xml representation
+        sentences = []
+        for rev in reviews:
+            sentences += rev['pros'] + rev['cons'] + ([rev['summary']] if rev['summary'] else [])
+        with self.metrics.timer('filter'):
+            irrelevant = self.filter_model.is_irrelevant_batch(sentences)
+        # parse threads of pipeline share counters
+        with self.statistic_lock:
+            self.sentences_count += len(sentences)
+            self.irrelevant_sentences_count += sum(irrelevant)
+
+        irrelevant = iter(irrelevant)
+        for rev in reviews:
+            rev['pros'] = [text for text in rev['pros'] if not next(irrelevant)]
+            rev['cons'] = [text for text in rev['cons'] if not next(irrelevant)]
+            if rev['summary'] and next(irrelevant):
+                rev['summary'] = ''
+
+        return reviews
+
+    def parse_review(self, rev: dict) -> Review:
+        """
+        Create review object from review record (extract_review), irrelevant sentences needs to be already removed
+        with filter_sentences.
         :param rev:
         :return:
         """
-
-        def _pro_cons(xml):
-            l = []
-            if xml:
-                for li in xml.find_all("li"):
-                    text = li.get_text()
-                    self.sentences_count += 1
-                    if self.filter_model.is_irrelevant(text):
-                        self.irrelevant_sentences_count += 1
-                        continue
-                    l.append(text)
-            return l
-
         review = Review()
         # author name
-        try:
-            author = rev.find("strong").get_text().strip()
-            review.set_author(author)
-        except Exception as e:
-            review.set_author('Anonym')
-
-        review_text = rev.find(class_="revtext")
+        review.set_author(rev['author'])
         # set date
-        review.set_date(rev.find(class_="date").get_text())
+        review.set_date(rev['date'])
         # set rating
-        rating = review_text.find(class_="hidden")
-        if rating:
-            review.set_rating(rating.get_text().replace("Hodnocení produktu: ", ""))
+        if rev['rating']:
+            review.set_rating(rev['rating'])
         # set recommendation
-        if review_text.find(class_="recommend-yes"):
-            review.set_recommends("YES")
-        elif review_text.find(class_="recommend-no"):
-            review.set_recommends("NO")
+        if rev['recommends']:
+            review.set_recommends(rev['recommends'])
         # set pros
-        review.set_pros(_pro_cons(review_text.find(class_="plus")))
+        review.set_pros(rev['pros'])
         # set cons
-        review.set_cons(_pro_cons(review_text.find(class_="minus")))
+        review.set_cons(rev['cons'])
         # set summary
-        if review_text.p:
-            text = review_text.p.get_text()
-            self.sentences_count += 1
-            if not self.filter_model.is_irrelevant(text):
-                review.set_summary(text)
-            else:
-                self.irrelevant_sentences_count += 1
+        if rev['summary']:
+            review.set_summary(rev['summary'])
 
         return review
 
-    def parse_product_revs(self, review_list, product: Product, category_domain):
+    def parse_product_revs(self, reviews: list, product: Product, category_domain):
         """
-        Parse product reviews from :param review list and save them to product.
+        Parse product reviews from :param reviews and save them to product.
         :param category_domain: domain of product category
-        :param review_list: xml of page
+        :param reviews: list of review records of page
         :param product: object that holds its reviews
         :return: True if the same review was found id DB, else False
         """
 
         try:
-            reviews = review_list.find_all(class_="review")
             l = product.get_name().split("(")
             product_name = l[0].strip()
 
             # for each review
-            for rev in reviews:
+            for rev in self.filter_sentences(reviews):
                 review = self.parse_review(rev)
 
                 # check if review is not empty
                 if not review.pros and not review.cons and not review.summary:
-                    self.total_empty_reviews += 1
+                    with self.statistic_lock:
+                        self.total_empty_reviews += 1
                     continue
 
-                review_elastic = self.connector.get_review_by_product_author_timestr(
-                    category_domain, product_name, review.author, review.date)
                 # review was found in elastic, which indicates that we have all reviews
-                if review_elastic:
+                if self.review_exists(category_domain, product_name, review.author, review.date):
                     return True
                 # else append review to product
                 product.add_review(review)
@@ -191,10 +310,10 @@ class HeurekaCrawler:
 
         return False
 
-    def parse_shop_revs(self, review_list, shop_name: str):
+    def parse_shop_revs(self, review_list: list, shop_name: str):
         """
         Parse shop reviews from review_list
-        :param review_list: xml of page
+        :param review_list: list of shop review records of page (extract_shop_reviews)
         :param shop_name: string
         :return:
         """
@@ -210,60 +329,43 @@ class HeurekaCrawler:
                 s.append([str(wb) for wb in sentence])
             return s
 
-        def _cons_pros(xml):
+        def _cons_pros(sentences: list):
             """
-            Parse xml for positive/negative section of ul elements
-            :param xml: beautiful soup instance
+            POS tag sentences of positive/negative section
+            :param sentences: list of relevant sentences
             :return: list of sentences, list of processed sentences: Tuple[list, List[List[List[str]]]]
             """
-            l_ = []
-            l_pos = []
-            if xml:
-                # loop over all list elements
-                for pro in xml.find_all('li'):
-                    # increase count of sentences and evaluate sentence with irrelevant model
-                    val = pro.get_text().strip()
-                    self.sentences_count += 1
-                    if self.filter_model.is_irrelevant(val):
-                        self.irrelevant_sentences_count += 1
-                        continue
-                    l_.append(val)
-                    l_pos.append(_get_str_pos(self.tagger.pos_tagging(val)))
-            return l_, l_pos
+            return sentences, [_get_str_pos(self.pos_tagging(val)) for val in sentences]
 
-        def _summary(xml):
+        def _summary(summary_text: str):
             """
-            Parse bs4 instance of summary and evaluate it with irrelevant model
-            :param xml:
+            POS tag summary
+            :param summary_text: relevant summary or empty string
             :return: sentence, list of processed sentences
             """
-            summary_text = xml.get_text().strip() if xml else ''
-            if summary_text and self.filter_model.is_irrelevant(summary_text):
+            if not summary_text:
                 return '', []
-            return summary_text, _get_str_pos(self.tagger.pos_tagging(summary_text))
+            return summary_text, _get_str_pos(self.pos_tagging(summary_text))
 
         r_d = {}
-        # parse each review in review list
-        for review in review_list:
+        new_reviews = []
+        found = False
+        # parse each review in review list, irrelevant sentences of page are removed at once
+        for review in self.filter_sentences(review_list):
             try:
-                # parse xmls
-                sum_xml = review.find(class_='c-post__summary')
-                author_xml = review.find(class_='c-post__author')
-                rating_xml = review.find(class_='c-rating-widget__value')
-                pros, pros_pos = _cons_pros(review.find(class_='c-attributes-list--pros'))
-                cons, cons_pos = _cons_pros(review.find(class_='c-attributes-list--cons'))
-                summary, summary_pos = _summary(sum_xml)
-                delivery_time_xml = review.find(class_='c-post__delivery-time')
-                date_obj = datetime.strptime(review.find(class_='c-post__publish-time').get('datetime'),
-                                             '%Y-%m-%d %H:%M:%S')
+                # evaluate sentences
+                pros, pros_pos = _cons_pros(review['pros'])
+                cons, cons_pos = _cons_pros(review['cons'])
+                summary, summary_pos = _summary(review['summary'])
+                date_obj = datetime.strptime(review['datetime'], '%Y-%m-%d %H:%M:%S')
                 # cerate review dict (json)
                 r_d = {
-                    'author': author_xml.get_text() if author_xml else 'author',
+                    'author': review['author'] if review['author'] else 'author',
                     'date': date_obj.isoformat(),
                     'date_str': date_obj.strftime('%d. %B %Y'),
-                    'recommends': 'YES' if review.find(class_='u-color-success') else 'NO',
-                    'delivery_time': delivery_time_xml.get_text() if delivery_time_xml else str(0),
-                    'rating': rating_xml.get_text().split()[0] + '%' if rating_xml else '',
+                    'recommends': 'YES' if review['recommends'] else 'NO',
+                    'delivery_time': review['delivery_time'] if review['delivery_time'] else str(0),
+                    'rating': review['rating'].split()[0] + '%' if review['rating'] else '',
                     'summary': summary, 'summary_pos': summary_pos,
                     'pros': pros, 'pros_pos': pros_pos,
                     'cons': cons, 'cons_pos': cons_pos,
@@ -271,14 +373,6 @@ class HeurekaCrawler:
                     'shop_name': shop_name,
                     'aspect': [],
                 }
-                review_text = self.rating_model.merge_review_text(
-                    r_d['pros'], r_d['cons'], r_d['summary'])
-
-                # perform evaluation with models
-                if review_text:
-                    rating_model = self.rating_model.eval_sentence(review_text)
-                    if rating_model:
-                        r_d['rating_model'] = rating_model
 
                 if self.filter_model.model:
                     r_d['filter_model'] = True
@@ -289,19 +383,35 @@ class HeurekaCrawler:
                 if not r_d['pros'] and not r_d['cons'] and not r_d['summary']:
                     self.total_empty_reviews += 1
                     continue
-                # if the review already exists return true else index it
-                if not self.connector.get_review_by_shop_author_timestr(
-                        r_d['shop_name'], r_d['author'], r_d['date']):
-                    self.total_review_count += 1
-                    if not self.connector.index("shop_review", r_d):
-                        print("Review of " + shop_name + " " + " not created", file=sys.stderr)
-                else:
-                    return True
+                # if the review already exists stop parsing else index it
+                if self.shop_review_exists(r_d['shop_name'], r_d['author'], r_d['date']):
+                    found = True
+                    break
+                new_reviews.append(r_d)
 
             except Exception as e:
                 print("[parse_shop_revs] Error: " + shop_name + " " + str(r_d) + " " + str(e), file=sys.stderr)
 
-        return False
+        # perform evaluation of all new reviews of page with rating model at once
+        self.rate_reviews(new_reviews)
+
+        def _review_outcome(r_d: dict):
+            indexed = self.review_indexed("shop_review", r_d['shop_name'], r_d['author'], r_d['date'])
+
+            def _outcome(outcome: str):
+                if outcome != CREATED:
+                    self.discount_statistic(total_review_count=1)
+                indexed(outcome)
+            return _outcome
+
+        with self.metrics.timer('index'):
+            for r_d in new_reviews:
+                self.total_review_count += 1
+                doc_id = review_id("shop_review", r_d['shop_name'], r_d['author'], r_d['date'])
+                if not self.connector.bulk_index("shop_review", r_d, doc_id, 'create', _review_outcome(r_d)):
+                    print("Review of " + shop_name + " " + " not created", file=sys.stderr)
+
+        return found
 
     def parse_shop_page(self, shop_list):
         """
@@ -310,31 +420,42 @@ class HeurekaCrawler:
         :return:
         """
 
-        def _task_shop_parse(shop_url: str, shop_name: str):
+        def _task_shop_parse(shop_url: str, shop_name: str, content: bytes = None):
             """
             Function performs parsing shop reviews on heureka.
             :param shop_url:
             :param shop_name:
+            :param content: already downloaded page of shop_url
             :return:
             """
-            shop_xml = BeautifulSoup(urlopen(shop_url), "lxml")
-            review_list = shop_xml.find_all(class_='c-post')
+            if content is None:
+                content = self.fetcher.fetch(shop_url)
+            shop_xml = self.parse_html(content)
             # found existing review signal to end crawl
-            if self.parse_shop_revs(review_list, shop_name):
+            if self.parse_shop_revs(extract_shop_reviews(shop_xml), shop_name):
                 return None
 
             # find section with new page
-            references = shop_xml.find(class_='c-pagination').find(class_='c-pagination__button')
+            return extract_shop_next_page(shop_xml)
 
-            return references.get('href') if references else None
-        # loop over all shop instances
+        # parse shop meta data
+        shops = []
         for shop in shop_list:
             try:
-                reviews = self.total_review_count
-                # parse shop meta data files
                 shop_url = 'https://obchody.heureka.cz' + shop.find(class_='c-shops-table__cell--rating').find('a').get(
                     'href')
                 shop_name = shop.find(class_='c-shops-table__cell--name').find('a').get_text().strip()
+                shops.append((shop, shop_url, shop_name))
+            except Exception as e:
+                print("[parse_shop_page] Error: " + str(e), file=sys.stderr)
+
+        # download first pages of shop reviews concurrently
+        pages = self.fetcher.fetch_all([shop_url for _, shop_url, _ in shops])
+
+        # loop over all shop instances
+        for (shop, shop_url, shop_name), (_, content) in zip(shops, pages):
+            try:
+                reviews = self.total_review_count
                 shop_exit_url_xml = shop.find(class_='c-shops-table__cell--name').find('a')
                 shop_exit_url = shop_exit_url_xml.get('href') if shop_exit_url_xml else ''
                 shop_info_xml = shop.find(class_='c-shops-table__cell--info').find('p')
@@ -356,7 +477,7 @@ class HeurekaCrawler:
                     print('Shop in db already ' + str(shop_name), file=sys.stderr)
 
                 # parse shop reviews
-                shop_ref = _task_shop_parse(shop_url, shop_name)
+                shop_ref = _task_shop_parse(shop_url, shop_name, content)
 
                 # loop over footer with references to next pages
                 while shop_ref:
@@ -387,12 +508,64 @@ class HeurekaCrawler:
 
         return categories_urls
 
-    def add_to_elastic(self, product, category):
+    def product_to_dict(self, product: Product, category: str) -> dict:
         """
-        Index product, category object to elastic.
+        Create product document from product object.
         :param product:
-        :param category:
-        :return:
+        :param category: domain category
+        :return: product document: dict
+        """
+        l = product.get_name().split("(")
+        return {
+            "product_name": l[0].strip(),
+            "category": l[-1][:-1],
+            "domain": self.connector.get_domain(category),
+            "category_list": product.get_category(),
+            "url": product.get_url()
+        }
+
+    def review_to_dict(self, review: Review, product: dict) -> dict:
+        """
+        Create review document of product.
+        :param review: review object
+        :param product: product document with product_name, category and domain
+        :return: review document: dict
+        """
+        rev_dic = {'author': review.author, 'rating': review.rating, 'recommends': review.recommends,
+                   'pros': review.pros, 'cons': review.cons, 'summary': review.summary, 'date_str': review.date,
+                   'category': product['category'], 'product_name': product['product_name'],
+                   'domain': product['domain']}
+        datetime_object = datetime.strptime(rev_dic["date_str"], '%d. %B %Y')
+        rev_dic["date"] = datetime_object.strftime('%Y-%m-%d')
+        return rev_dic
+
+    def filter_review(self, review: Review):
+        """
+        Filter irrelevant sentences of parsed review with filter model.
+        :param review:
+        :return: True if review is empty after filtering
+        """
+        summary = [review.summary] if review.summary else []
+        sentences = review.pros + review.cons + summary
+        with self.metrics.timer('filter'):
+            irrelevant = self.filter_model.is_irrelevant_batch(sentences)
+        self.sentences_count += len(sentences)
+        self.irrelevant_sentences_count += sum(irrelevant)
+
+        irrelevant = iter(irrelevant)
+        review.set_pros([sentence for sentence in review.pros if not next(irrelevant)])
+        review.set_cons([sentence for sentence in review.cons if not next(irrelevant)])
+        if summary and next(irrelevant):
+            review.set_summary('')
+
+        return not review.pros and not review.cons and not review.summary
+
+    def enrich_review(self, rev_dic: dict, rate: bool = True) -> dict:
+        """
+        Append POS tagged sentences and outcome of models to review document.
+        :param rev_dic: review document
+        :param rate: evaluate review with rating model, reviews can be rated later in batch with rate_reviews
+        :return: review document: dict
         """
 
         def get_str_pos(l: list):
@@ -406,159 +579,289 @@ class HeurekaCrawler:
                 s.append([str(wb) for wb in sentence])
             return s
 
+        pro_pos = []
+        cons_pos = []
+
+        for pos in rev_dic["pros"]:
+            pro_pos.append(get_str_pos(self.pos_tagging(pos)))
+
+        for con in rev_dic["cons"]:
+            cons_pos.append(get_str_pos(self.pos_tagging(con)))
+
+        summary_pos = get_str_pos(self.pos_tagging(rev_dic["summary"]))
+
+        rev_dic["pro_POS"] = pro_pos
+        rev_dic["cons_POS"] = cons_pos
+        rev_dic["summary_POS"] = summary_pos
+        # evaluate text with given models
+        if rate:
+            self.rate_reviews([rev_dic])
+        # filter model
+        if self.filter_model.model:
+            rev_dic['filter_model'] = True
+        else:
+            rev_dic['filter_model'] = False
+
+        return rev_dic
+
+    def rate_reviews(self, reviews: list):
+        """
+        Evaluate review documents with rating model in one batch.
+        :param reviews: list of review documents
+        :return:
+        """
+        if not self.rating_model.regression_model:
+            return
+        reviews = [(rev_dic, self.rating_model.merge_review_text(rev_dic['pros'], rev_dic['cons'],
+                                                                 rev_dic['summary'])) for rev_dic in reviews]
+        reviews = [(rev_dic, review_text) for rev_dic, review_text in reviews if review_text]
+        with self.metrics.timer('rating'):
+            ratings = self.rating_model.eval_sentences([review_text for _, review_text in reviews])
+        for (rev_dic, _), rating_model in zip(reviews, ratings):
+            if rating_model:
+                rev_dic['rating_model'] = rating_model
+
+    def index_product(self, product: dict, reviews: list):
+        """
+        Index product document, if it is not already in elastic, and its review documents. Documents are counted when
+        they are buffered, documents that are not indexed are subtracted from statistics after flush (flush_bulk).
+        :param product: product document
+        :param reviews: list of review documents
+        :return: count of new products, count of reviews of new products, count of indexed reviews
+        """
         review_count = 0
         product_new_count = 0
         review_new_count_new = 0
-        l = product.get_name().split("(")
-        sub_cat_name = l[-1][:-1]
-        product_name = l[0].strip()
-        domain = self.connector.get_domain(category)
-
-        # index product if it is no already in elastic
-        if not self.connector.get_product_by_name(product_name):
-            product_elastic = {
-                "product_name": product_name,
-                "category": sub_cat_name,
-                "domain": domain,
-                "category_list": product.get_category(),
-                "url": product.get_url()
-            }
+        product_name = product['product_name']
+        # new product and its counted reviews, buffer can be flushed while product is indexed
+        state = {'new': False, 'reviews': 0}
+
+        def _product_outcome(outcome: str):
+            if outcome == FAILED and state['new']:
+                state['new'] = False
+                self.discount_statistic(total_product_new_count=1, total_review_new_count=state['reviews'])
+
+        def _review_outcome(rev_dic: dict):
+            indexed = self.review_indexed(product['domain'], product_name, rev_dic['author'], rev_dic['date_str'])
+
+            def _outcome(outcome: str):
+                if outcome != CREATED:
+                    if state['new']:
+                        state['reviews'] -= 1
+                        self.discount_statistic(total_review_count=1, total_review_new_count=1)
+                    else:
+                        self.discount_statistic(total_review_count=1)
+                indexed(outcome)
+            return _outcome
+
+        with self.metrics.timer('index'):
+            # index product if it is no already in elastic
+            if not self.connector.get_product_by_name(product_name):
+                state['new'] = True
+                state['reviews'] = len(reviews)
+                if not self.connector.bulk_index("product", product, callback=_product_outcome):
+                    state['new'] = False
+                    print("Product of " + product_name + " " + " not created", sys.stderr)
+                else:
+                    # increase statistics
+                    product_new_count += 1
+                    review_new_count_new += len(reviews)
+
+            # loop over product reviews
+            for rev_dic in reviews:
+                doc_id = review_id(product['domain'], product_name, rev_dic['author'], rev_dic['date_str'])
+                if not self.connector.bulk_index(product['domain'], rev_dic, doc_id, 'create',
+                                                 _review_outcome(rev_dic)):
+                    print("Review of " + product_name + " " + " not created", sys.stderr)
+                else:
+                    review_count += 1
 
-            if not self.connector.index("product", product_elastic):
-                print("Product of " + product_name + " " + " not created", sys.stderr)
-            else:
-                # increase statistics
-                product_new_count += 1
-                review_new_count_new += len(product.get_reviews())
+        return product_new_count, review_new_count_new, review_count
+
+    def add_to_elastic(self, product, category):
+        """
+        Index product, category object to elastic.
+        :param product:
+        :param category:
+        :return:
+        """
+        product_dic = self.product_to_dict(product, category)
+        reviews = []
 
         # loop over product reviews
         for rev in product.get_reviews():
             try:
-                # create review representation as dictionary
-                rev_dic = {'author': rev.author, 'rating': rev.rating, 'recommends': rev.recommends,
-                           'pros': rev.pros, 'cons': rev.cons, 'summary': rev.summary, 'date_str': rev.date,
-                           'category': sub_cat_name, 'product_name': product_name, 'domain': domain}
-                datetime_object = datetime.strptime(rev_dic["date_str"], '%d. %B %Y')
-                rev_dic["date"] = datetime_object.strftime('%Y-%m-%d')
-                pro_pos = []
-                cons_pos = []
-
-                for pos in rev_dic["pros"]:
-                    pro_pos.append(get_str_pos(self.tagger.pos_tagging(pos)))
-
-                for con in rev_dic["cons"]:
-                    cons_pos.append(get_str_pos(self.tagger.pos_tagging(con)))
-
-                summary_pos = get_str_pos(self.tagger.pos_tagging(rev_dic["summary"]))
-
-                rev_dic["pro_POS"] = pro_pos
-                rev_dic["cons_POS"] = cons_pos
-                rev_dic["summary_POS"] = summary_pos
-                review_text = self.rating_model.merge_review_text(
-                    rev_dic['pros'], rev_dic['cons'], rev_dic['summary'])
-                # evaluate text with given models
-                if review_text:
-                    # rating model
-                    rating_model = self.rating_model.eval_sentence(review_text)
-                    if rating_model:
-                        rev_dic['rating_model'] = rating_model
-                # filter model
-                if self.filter_model.model:
-                    rev_dic['filter_model'] = True
-                else:
-                    rev_dic['filter_model'] = False
-
-                if not self.connector.index(domain, rev_dic):
-                    print("Review of " + product_name + " " + " not created", sys.stderr)
-                else:
-                    review_count += 1
+                # create review representation as dictionary and evaluate it
+                reviews.append(self.enrich_review(self.review_to_dict(rev, product_dic), False))
             except Exception as e:
-                print("[add_to_elastic] Error: " + str(e) + ' ' + str(rev_dic), file=sys.stderr)
+                print("[add_to_elastic] Error: " + str(e) + ' ' + str(rev.__dict__), file=sys.stderr)
 
-        return product_new_count, review_new_count_new, review_count
+        # rate all reviews of product at once
+        self.rate_reviews(reviews)
 
-    def actualize_reviews(self, obj_product_dict, category_domain, fast: bool):
+        return self.index_product(product_dic, reviews)
+
+    def actualize_reviews(self, obj_product_dict, category_domain, fast: bool, watermarks: dict = None,
+                          emit=None):
         """
-        Method actualize every subcategory of main category domain
+        Method actualize every subcategory of main category domain. Pages of all subcategories are crawled in rounds,
+        every round downloads next page of each subcategory concurrently. With http cache subcategory ends with the first
+        page that was not modified since the last actualization. In fast mode subcategory with watermark ends with the
+        first review, that is not newer than watermark, without queries to elastic.
         :param obj_product_dict: actualized objects of products
         :param category_domain:
         :param fast:
+        :param watermarks: watermarks of subcategories from the last actualization, dict is updated with the newest
+        reviews of subcategories
+        :param emit: function called with every product with new reviews of round, products are not kept in
+        obj_product_dict after round, so product can be emitted again with reviews of next pages
         :return:
         """
+        if watermarks is None:
+            watermarks = {}
+        last_watermarks = dict(watermarks)
         categories_urls = self.get_urls(category_domain, "top-recenze/")
-        # loop over product urls
-        for category_url in categories_urls:
-            try:
-                next_ref = " "
-                while next_ref:
+        # subcategory url to reference of the next page
+        pending = [(category_url, " ") for category_url in categories_urls]
+
+        while pending:
+            next_pending = []
+            new_reviews = []
+
+            for batch in batches(pending, self.batch_size):
+                pages = self.fetcher.fetch_all([category_url + next_ref for category_url, next_ref in batch],
+                                               self.http_cache.get if self.http_cache else None)
+                for (category_url, ref), (_, content) in zip(batch, pages):
+                    if content is None:
+                        print("[actualize_reviews] Error: page was not downloaded", file=sys.stderr)
+                        print(category_url, file=sys.stderr)
+                        continue
+                    # page was not modified since the last actualization, so there are no new reviews on next pages
+                    if content is NOT_MODIFIED:
+                        continue
                     try:
-                        infile = BeautifulSoup(urlopen(category_url + next_ref), "lxml")
+                        infile = self.parse_html(content)
+                        next_ref, newest = self.__actualize_page(infile, new_reviews, category_url, category_domain,
+                                                                 fast, last_watermarks.get(category_url) if fast
+                                                                 else None)
+                        # the first page holds the newest review of subcategory
+                        if ref == " " and newest:
+                            watermarks[category_url] = newest
+                        if next_ref:
+                            next_pending.append((category_url, next_ref))
                     except Exception as e:
-                        print("[actualize_reviews] Error: " + str(e), file=sys.stderr)
+                        print("[actualize_reviews] Error references: " + str(e), file=sys.stderr)
                         print(category_url, file=sys.stderr)
-                        break
-                    review_list = infile.find_all(class_="review")
-                    for rev in review_list:
-                        try:
-                            product = rev.find("h4")
-                            # Create product
-                            product_name_raw = product.get_text()
-                            url = product.find("a").get('href')
-                            category = url.split(".")[0].split("//")[1]
-                            product_name = product_name_raw + " (" + category + ")"
-
-                            url += "/recenze/"
-                            product_obj = Product(url)
-                            product_obj.set_name(product_name)
-                            p = BeautifulSoup(urlopen(url), "lxml")
-
-                            product_category = ""
-
-                            for a in p.find(id="breadcrumbs").find_all("a")[:-1]:
-                                product_category += a.get_text() + " | "
-                            product_obj.set_category(product_category[:-2])
-
-                            # parse review
-                            review = self.parse_review(rev)
-
-                            # check if review is not empty
-                            if not review.pros and not review.cons and not review.summary:
-                                self.total_empty_reviews += 1
-                                continue
-
-                            product_obj.add_review(review)
-                            # if there is a review with the same date, author and product
-                            if self.connector.get_review_by_product_author_timestr(
-                                    category_domain, product_name_raw, review.author, review.date):
-                                # fast method does not count all reviews, so after first match it ends
-                                if fast:
-                                    next_ref = None
-                                    break
-                                continue
-                            # append product to dictionary of actualized products
-                            if product_name in obj_product_dict:
-                                obj_product_dict[product_name].add_review(review)
-                            else:
-                                obj_product_dict[product_name] = product_obj
 
-                        except Exception as e:
-                            print("[actualize_reviews] Error: " + str(e), file=sys.stderr)
-                            print(category_url, file=sys.stderr)
-                            pass
-                    # go to the next page
-                    if next_ref is None:
-                        break
+            self.__actualize_products(obj_product_dict, new_reviews)
+            if emit:
+                for product in obj_product_dict.values():
+                    emit(product)
+                obj_product_dict.clear()
+            pending = next_pending
 
-                    references = infile.find(class_="pag bot").find("a", "next")
+    def __actualize_page(self, infile, new_reviews: list, category_url: str, category_domain: str, fast: bool,
+                         watermark: dict = None):
+        """
+        Parse reviews from one page of subcategory top reviews and append new ones to new_reviews.
+        :param infile: parsed page (parse_html)
+        :param new_reviews: list of tuples (product name, product url, review)
+        :param category_url: url of subcategory
+        :param category_domain:
+        :param fast:
+        :param watermark: watermark of subcategory, reviews are not checked in elastic if it is given
+        :return: reference to the next page or None, watermark of the first review of page
+        """
+        newest = None
+        for rev in self.filter_sentences(extract_reviews(infile)):
+            try:
+                # Create product
+                product_name_raw = rev['product_name']
+                url = rev['product_url']
+                category = url.split(".")[0].split("//")[1]
+                product_name = product_name_raw + " (" + category + ")"
+                url += "/recenze/"
+
+                # parse review
+                review = self.parse_review(rev)
+
+                identity = review_id(category_domain, product_name_raw, review.author, review.date)
+                review_date = datetime.strptime(review.date, '%d. %B %Y').strftime('%Y-%m-%d')
+                if newest is None:
+                    newest = {'url': category_url, 'review': identity, 'date': review_date}
+
+                # reviews are ordered from the newest one, so reviews from watermark were already actualized
+                if watermark and (identity == watermark['review'] or review_date < watermark['date']):
+                    return None, newest
+
+                # check if review is not empty
+                if not review.pros and not review.cons and not review.summary:
+                    self.total_empty_reviews += 1
+                    continue
+
+                # if there is a review with the same date, author and product
+                if not watermark and self.review_exists(category_domain, product_name_raw, review.author,
+                                                        review.date):
+                    # fast method does not count all reviews, so after first match it ends
+                    if fast:
+                        return None, newest
+                    continue
+
+                new_reviews.append((product_name, url, review))
 
-                    if references:
-                        next_ref = references.get('href')
-                    else:
-                        next_ref = None
-                        break
             except Exception as e:
-                print("[actualize_reviews] Error references: " + str(e), file=sys.stderr)
+                print("[actualize_reviews] Error: " + str(e), file=sys.stderr)
                 print(category_url, file=sys.stderr)
+                pass
+
+        # go to the next page
+        return extract_next_page(infile), newest
+
+    def __actualize_products(self, obj_product_dict, new_reviews: list):
+        """
+        Append new reviews to products, breadcrumbs of new products are taken from category cache of connector, only
+        product pages of unknown products are downloaded concurrently.
+        :param obj_product_dict: actualized objects of products
+        :param new_reviews: list of tuples (product name, product url, review)
+        :return:
+        """
+        urls = []
+        for product_name, url, _ in new_reviews:
+            if product_name not in obj_product_dict and url not in urls and \
+                    self.connector.get_category_list(url) is None:
+                urls.append(url)
+
+        pages = dict(self.fetcher.fetch_all(urls))
+
+        for product_name, url, review in new_reviews:
+            # append product to dictionary of actualized products
+            if product_name in obj_product_dict:
+                obj_product_dict[product_name].add_review(review)
+                continue
+
+            try:
+                product_category = self.connector.get_category_list(url)
+                if product_category is None:
+                    if pages.get(url) is None:
+                        raise IOError("Cant open " + url)
+                    product_category = ""
+                    for a in extract_breadcrumbs(self.parse_html(pages[url]))[:-1]:
+                        product_category += a + " | "
+                    product_category = product_category[:-2]
+                    self.connector.cache_category_list(url, product_category)
+                    self.metrics.inc('category_cache_misses')
+                else:
+                    self.metrics.inc('category_cache_hits')
+
+                product_obj = Product(url)
+                product_obj.set_name(product_name)
+                product_obj.set_category(product_category)
+
+                product_obj.add_review(review)
+                obj_product_dict[product_name] = product_obj
+
+            except Exception as e:
+                print("[actualize_reviews] Error: " + str(e), file=sys.stderr)
 
     def task_seed_aspect_extraction(self, category: str, path: str):
         """
@@ -573,69 +876,77 @@ class HeurekaCrawler:
             # get hereka parameters of product categories, that might resemblance aspects
             # and save them to file
             with open(path + "/" + category + "_aspects.txt", "w") as aspect_file:
-                for url in categories_urls:
-                    try:
-                        # print(url)
-                        page = BeautifulSoup(urlopen(url), "lxml")
-                        breadcrumbs = ""
-                        max_occurence = 0
-
-                        for a in page.find(id="breadcrumbs").find_all("a"):
-                            breadcrumbs += a.get_text() + " | "
-                        breadcrumbs = breadcrumbs[:-2]
-                        name = url.split(".")[0].split("//")[1]
-                        aspect_cat = AspectCategory(name, breadcrumbs, url)
-                        filters = page.find(id="param-container").find_all(class_="filtr")
-
-                        # parse aspect and its values
-                        for filter_element in filters:
-                            aspect_name = filter_element.find("h3").get_text()
-                            aspect = Aspect(aspect_name)
-                            # nonscript is text, no idea why but heureka
-                            non_script = filter_element.find("noscript")
-                            xml_li = filter_element.find_all("li")
-
-                            if non_script:
-                                xml_li = non_script.find_all("li")
-                            val_list = []
-                            for value in xml_li:
-                                v = value.find("a").get_text()
-                                occurence = 0
-                                try:
-                                    oc_str = value.find("span").get_text()
-                                    oc_str = re.sub('[^0-9]', '', oc_str)
-                                    occurence = int(oc_str)
-
-                                except Exception as e:
-                                    print(e)
-                                    pass
-                                if occurence > max_occurence:
-                                    max_occurence = occurence
-                                val_list.append((v, occurence))
-
-                            # we want just 1% of max value occurence in out aspect list
-                            delta = int(max_occurence * 0.01)
-                            for val, occurence in val_list:
-                                if occurence > delta:
-                                    aspect.add_value(val)
-
-                            aspect_cat.add_aspect(aspect)
-                        aspect_file.write(str(aspect_cat) + "\n")
-                        print(url + " " + str(len(aspect_cat.aspects)))
+                for batch in batches(categories_urls, self.batch_size):
+                    for url, content in self.fetcher.fetch_all(batch):
+                        try:
+                            if content is None:
+                                raise IOError("Cant open " + url)
+                            page = BeautifulSoup(content, "lxml")
+                            breadcrumbs = ""
+                            max_occurence = 0
+
+                            for a in page.find(id="breadcrumbs").find_all("a"):
+                                breadcrumbs += a.get_text() + " | "
+                            breadcrumbs = breadcrumbs[:-2]
+                            name = url.split(".")[0].split("//")[1]
+                            aspect_cat = AspectCategory(name, breadcrumbs, url)
+                            filters = page.find(id="param-container").find_all(class_="filtr")
+
+                            # parse aspect and its values
+                            for filter_element in filters:
+                                aspect_name = filter_element.find("h3").get_text()
+                                aspect = Aspect(aspect_name)
+                                # nonscript is text, no idea why but heureka
+                                non_script = filter_element.find("noscript")
+                                xml_li = filter_element.find_all("li")
+
+                                if non_script:
+                                    xml_li = non_script.find_all("li")
+                                val_list = []
+                                for value in xml_li:
+                                    v = value.find("a").get_text()
+                                    occurence = 0
+                                    try:
+                                        oc_str = value.find("span").get_text()
+                                        oc_str = re.sub('[^0-9]', '', oc_str)
+                                        occurence = int(oc_str)
+
+                                    except Exception as e:
+                                        print(e)
+                                        pass
+                                    if occurence > max_occurence:
+                                        max_occurence = occurence
+                                    val_list.append((v, occurence))
+
+                                # we want just 1% of max value occurence in out aspect list
+                                delta = int(max_occurence * 0.01)
+                                for val, occurence in val_list:
+                                    if occurence > delta:
+                                        aspect.add_value(val)
+
+                                aspect_cat.add_aspect(aspect)
+                            aspect_file.write(str(aspect_cat) + "\n")
+                            print(url + " " + str(len(aspect_cat.aspects)))
 
-                    except Exception as e:
-                        print("[task_seed_aspect_extraction] Error: " + str(e))
+                        except Exception as e:
+                            print("[task_seed_aspect_extraction] Error: " + str(e))
 
         except Exception as e:
             print("[task_seed_aspect_extraction] Error " + str(e), file=sys.stderr)
 
-    def task_actualize(self, category: str, fast: bool):
+    def task_actualize(self, category: str, fast: bool, stream: bool = False):
         """
         Task actualizes product reviews from main domain category.
         :param category: domain category
         :param fast:
+        :param stream: index products with new reviews after every round of pages instead of after the whole domain
         :return:
         """
+        # breadcrumbs of known products are not downloaded during actualization
+        if not self.category_cache_warm:
+            print('Cached product categories: ' + str(self.connector.warm_category_cache()))
+            self.category_cache_warm = True
+
         try:
             # dict of actualized products
             actualized_dict_of_products = {}
@@ -644,32 +955,73 @@ class HeurekaCrawler:
             products_count = 0
             product_new_count = 0
             review_new_count_new = 0
-            # actualize products reviews for concrete domain category
-            self.actualize_reviews(actualized_dict_of_products, category, fast)
-            # loop over actualized products, get statistics and save reviews with products to elastic
-            for _, product in actualized_dict_of_products.items():
+            # names of indexed and new products, streamed product can be indexed in more rounds
+            indexed_products = set()
+            new_products = set()
+            # documents of category, that fail in bulk, are indexed again by the next actualization
+            failed_count = self.connector.get_bulk_failed_count()
+
+            def _index_product(product: Product):
+                """
+                Save product with its reviews to elastic and get statistics.
+                :param product:
+                :return:
+                """
+                nonlocal review_count, products_count, product_new_count, review_new_count_new
                 try:
-                    # Statistics
-                    products_count += 1
-
-                    # Save product elastic and get statistics
                     p_n_c, r_n_c_n, rev_cnt = self.add_to_elastic(product, category)
+                    if product.get_name() not in indexed_products:
+                        indexed_products.add(product.get_name())
+                        products_count += 1
+                    if p_n_c:
+                        new_products.add(product.get_name())
+                    elif product.get_name() in new_products:
+                        # next reviews of product created in this actualization
+                        r_n_c_n = rev_cnt
                     review_count += rev_cnt
                     product_new_count += p_n_c
                     review_new_count_new += r_n_c_n
                 except Exception as e:
                     print("[actualize-statistics] " + str(e), file=sys.stderr)
 
-            self.submit_statistic(category, review_count, products_count,
-                                  product_new_count, review_new_count_new)
+            # watermarks of subcategories from the last actualization
+            watermarks = self.connector.get_actualization_watermarks(category) if fast else {}
+            # actualize products reviews for concrete domain category
+            self.actualize_reviews(actualized_dict_of_products, category, fast, watermarks,
+                                   _index_product if stream else None)
+            # loop over actualized products, get statistics and save reviews with products to elastic
+            for _, product in actualized_dict_of_products.items():
+                _index_product(product)
 
+            # counted documents are added to total statistics, flush_bulk subtracts the ones that were not indexed
             self.total_review_count += review_count
             self.total_products_count += products_count
             self.total_review_new_count += review_new_count_new
             self.total_product_new_count += product_new_count
 
+            # documents, that were not indexed, are subtracted from statistics of category
+            discounted = self.flush_bulk(refresh=False)
+            review_count -= discounted['total_review_count']
+            product_new_count -= discounted['total_product_new_count']
+            review_new_count_new -= discounted['total_review_new_count']
+
+            # watermarks are not moved over failed reviews, next actualization keeps the previous ones
+            failed = self.connector.get_bulk_failed_count() > failed_count
+            self.submit_statistic(category, review_count, products_count, product_new_count, review_new_count_new,
+                                  list(watermarks.values()) if not failed else None)
+
+            # reviews of downloaded pages are indexed, so pages can be skipped if they do not change
+            if self.http_cache:
+                if not failed:
+                    self.http_cache.commit()
+                else:
+                    self.http_cache.discard()
+
         except Exception as e:
             print("[actualize] " + str(e), file=sys.stderr)
+            # reviews of downloaded pages may not be indexed
+            if self.http_cache:
+                self.http_cache.discard()
 
     def task_shop(self):
         """
@@ -699,7 +1051,7 @@ class HeurekaCrawler:
             :param url:
             :return:
             """
-            shop_page = BeautifulSoup(urlopen(url), "lxml")
+            shop_page = BeautifulSoup(self.fetcher.fetch(url), "lxml")
 
             shop_list = shop_page.find_all(class_="c-shops-table__row")
             self.parse_shop_page(shop_list)
@@ -720,141 +1072,295 @@ class HeurekaCrawler:
             except Exception as e:
                 print("[task_shop] Exception for " + url + " " + str(e), file=sys.stderr)
 
+        # index buffered reviews and refresh indexes
+        self.flush_bulk()
+
     def task_repair(self, min_rec_count: int):
         """
         Crawl products, that have less then min_rec_count count of reviews
         :param min_rec_count:
         :return:
         """
-        def get_str_pos(l: list):
+        def _repair_product(product: dict, content: bytes):
             """
-            Inner function for dumping WordPos object to dictionary as list
-            :param l: list of WordPos objects
-            :return: list of strings
+            Crawl all pages of product reviews and index missing reviews.
+            :param product: product document
+            :param content: already downloaded first page of product reviews
+            :return: count of indexed reviews
             """
-            s = []
-            for sentence in l:
-                s.append([str(wb) for wb in sentence])
-            return s
-
-        repaired_products = 0
-        repaired_reviews = 0
-        # get all products from elastic
-        products = self.connector.match_all('product')
-
-        progress = 0
-        products_len = len(products)
-        # loop over products
-        for product in products:
-            # progress
-            progress += 1
-            if progress % 10000 == 0:
-                print('{} products of {}'.format(str(progress), str(products_len)))
-
-            # get count of reviews for given product
-            revs = self.connector.get_product_rev_cnt(product['product_name'])
-            # if the count is less then minimum crawl all reviews of that product
-            if revs < min_rec_count:
-                review_cnt = 0
-                next_ref = " "
-                while next_ref:
+            review_cnt = 0
+            next_ref = " "
+            while next_ref:
+                try:
+                    if content is None:
+                        content = self.fetcher.fetch(product['url'] + next_ref)
+                    infile = self.parse_html(content)
+                    content = None
+                except Exception as e:
+                    print("[task_repair] Error: " + str(e), file=sys.stderr)
+                    print(product['url'], file=sys.stderr)
+                    break
+
+                review_list = self.filter_sentences(extract_reviews(infile))
+                # no reviews
+                if not review_list:
+                    break
+                # loop over all product reviews
+                new_reviews = []
+                for rev in review_list:
                     try:
-                        infile = BeautifulSoup(urlopen(product['url'] + next_ref), "lxml")
+                        review = self.parse_review(rev)
+                        # if the review already exists continue
+                        if self.review_exists(product['domain'], product['product_name'], review.author,
+                                              review.date):
+                            continue
+                        # review dictionary evaluated with available models
+                        new_reviews.append((review, self.enrich_review(self.review_to_dict(review, product), False)))
                     except Exception as e:
                         print("[task_repair] Error: " + str(e), file=sys.stderr)
-                        print(product['url'], file=sys.stderr)
-                        break
-
-                    review_list = infile.find_all(class_="review")
-                    # no reviews
-                    if not review_list:
-                        break
-                    # loop over all product reviews
-                    for rev in review_list:
-                        try:
-                            review = self.parse_review(rev)
-                            # if the review already exists continue
-                            if self.connector.get_review_by_product_author_timestr(
-                                    product['domain'], product['product_name'], review.author, review.date):
-                                continue
-                            # review dictionary
-                            rev_dic = {'author': review.author, 'rating': review.rating,
-                                       'recommends': review.recommends, 'pros': review.pros, 'cons': review.cons,
-                                       'summary': review.summary, 'date_str': review.date,
-                                       'category': product['category'], 'product_name': product['product_name'],
-                                       'domain': product['domain']}
-
-                            datetime_object = datetime.strptime(rev_dic["date_str"], '%d. %B %Y')
-                            rev_dic["date"] = datetime_object.strftime('%Y-%m-%d')
-                            pro_pos = []
-                            cons_pos = []
-
-                            for pos in rev_dic["pros"]:
-                                pro_pos.append(get_str_pos(self.tagger.pos_tagging(pos)))
-
-                            for con in rev_dic["cons"]:
-                                cons_pos.append(get_str_pos(self.tagger.pos_tagging(con)))
-
-                            summary_pos = get_str_pos(self.tagger.pos_tagging(rev_dic["summary"]))
-
-                            rev_dic["pro_POS"] = pro_pos
-                            rev_dic["cons_POS"] = cons_pos
-                            rev_dic["summary_POS"] = summary_pos
-                            # evaluate review text with available models
-                            review_text = self.rating_model.merge_review_text(
-                                rev_dic['pros'], rev_dic['cons'], rev_dic['summary'])
-                            # rating model
-                            rating_model = self.rating_model.eval_sentence(review_text)
-                            if rating_model:
-                                rev_dic['rating_model'] = rating_model
-                            # filter model
-                            if self.filter_model.model:
-                                rev_dic['filter_model'] = True
-                            else:
-                                rev_dic['filter_model'] = False
-                            # index review to elastic
-                            if not self.connector.index(product['domain'], rev_dic):
-                                print("Review of " + product['product_name'] + " " + " not created", sys.stderr)
-                            else:
-                                repaired_reviews += 1
-                                review_cnt += 1
+                        print(product['product_name'], file=sys.stderr)
 
-                        except Exception as e:
-                            print("[task_repair] Error: " + str(e), file=sys.stderr)
-                            print(product['product_name'], file=sys.stderr)
+                # rate all new reviews of page at once
+                self.rate_reviews([rev_dic for _, rev_dic in new_reviews])
 
-                    # find next page reference or break
-                    if next_ref is None:
-                        break
+                for review, rev_dic in new_reviews:
                     try:
-                        references = infile.find(class_="pag bot").find("a", "next")
-
-                        if references:
-                            next_ref = references.get('href')
+                        # index review to elastic
+                        doc_id = review_id(product['domain'], product['product_name'], review.author, review.date)
+                        indexed = self.review_indexed(product['domain'], product['product_name'], review.author,
+                                                      review.date)
+                        if not self.connector.bulk_index(product['domain'], rev_dic, doc_id, 'create', indexed):
+                            print("Review of " + product['product_name'] + " " + " not created", sys.stderr)
                         else:
-                            next_ref = None
-                            break
+                            review_cnt += 1
+
                     except Exception as e:
-                        print("[task_repair] references Error: " + str(e), file=sys.stderr)
+                        print("[task_repair] Error: " + str(e), file=sys.stderr)
                         print(product['product_name'], file=sys.stderr)
-                        next_ref = None
-                        pass
+
+                # find next page reference or break
+                try:
+                    next_ref = extract_next_page(infile)
+                    if not next_ref:
+                        break
+                except Exception as e:
+                    print("[task_repair] references Error: " + str(e), file=sys.stderr)
+                    print(product['product_name'], file=sys.stderr)
+                    next_ref = None
+                    pass
+
+            return review_cnt
+
+        def _repair_products(candidates: list):
+            """
+            Download first pages of candidate products concurrently and repair them.
+            :param candidates: list of product documents
+            :return: count of repaired products and count of indexed reviews
+            """
+            products_cnt = 0
+            reviews_cnt = 0
+            pages = self.fetcher.fetch_all([product['url'] + " " for product in candidates])
+            for product, (_, content) in zip(candidates, pages):
+                review_cnt = _repair_product(product, content)
                 # statistics
+                reviews_cnt += review_cnt
                 if review_cnt > 0:
-                    repaired_products += 1
+                    products_cnt += 1
+            return products_cnt, reviews_cnt
+
+        repaired_products = 0
+        repaired_reviews = 0
+        candidates_count = 0
+        # stream names of products with less then minimum reviews from elastic aggregation
+        product_names = self.connector.get_products_under_rev_cnt(min_rec_count)
+
+        try:
+            for names in batches(product_names, self.batch_size):
+                # crawl all reviews of candidate products
+                candidates = self.connector.get_products_by_names(names)
+                p_cnt, r_cnt = _repair_products(candidates)
+                repaired_products += p_cnt
+                repaired_reviews += r_cnt
+
+                # progress
+                candidates_count += len(names)
+                print('{} candidate products'.format(str(candidates_count)))
+
+        except Exception as e:
+            print("[task_repair] Error: " + str(e), file=sys.stderr)
+
+        # index buffered reviews and refresh indexes
+        self.flush_bulk()
 
         print('Products repaired: {}'.format(str(repaired_products)))
         print('Reviews pushed: {}'.format(str(repaired_reviews)))
 
-    def task(self, category: str, path: str):
+    def parse_product(self, url: str, content: bytes, category: str, parsed_products=()):
+        """
+        Parse product page with its reviews.
+        :param url: url of product reviews
+        :param content: downloaded product page
+        :param category: domain category
+        :param parsed_products: names of already parsed products
+        :return: product object or None if product does not have name or it was already parsed
+        """
+        page = extract_product(self.parse_html(content))
+        product = Product(url)
+
+        if page['name']:
+            product.set_name(page['name'] + ' (' + url.split(".")[0].split("//")[1] + ')')
+        # no product name no reviews for that product
+        else:
+            return None
+
+        # Handle collision
+        if product.get_name() in parsed_products:
+            return None
+
+        product_category = ""
+
+        # category list -> category_domain | sub_cat1 | subcat2...
+        for a in page['category']:
+            product_category += a + " | "
+        product.set_category(product_category[:-2])
+
+        # get reviews
+        self.parse_product_page(page, product, category)
+
+        return product
+
+    def enrich_product(self, product_dic: dict, product: Product):
+        """
+        Filter reviews of product with filter model and create enriched review documents.
+        :param product_dic: product document
+        :param product: product object with reviews
+        :return: product document, list of review documents, count of sentences, count of irrelevant sentences, count
+        of empty reviews
+        """
+        sentences_count = self.sentences_count
+        irrelevant_sentences_count = self.irrelevant_sentences_count
+        total_empty_reviews = self.total_empty_reviews
+        reviews = []
+
+        for rev in product.get_reviews():
+            try:
+                if self.filter_review(rev):
+                    self.total_empty_reviews += 1
+                    continue
+                reviews.append(self.enrich_review(self.review_to_dict(rev, product_dic), False))
+            except Exception as e:
+                print("[enrich_product] Error: " + str(e) + ' ' + str(rev.__dict__), file=sys.stderr)
+
+        # rate all reviews of product at once
+        self.rate_reviews(reviews)
+
+        return product_dic, reviews, self.sentences_count - sentences_count, \
+            self.irrelevant_sentences_count - irrelevant_sentences_count, self.total_empty_reviews - total_empty_reviews
+
+    def task_pipeline(self, categories, path: str, enrich_args: tuple, fetch_workers: int = 16,
+                      parse_workers: int = 4, enrich_workers: int = 4, index_workers: int = 2):
+        """
+        Task for product reviews crawling as staged pipeline: fetch -> parse -> enrich -> index. Enrichment (filtering,
+        POS tagging and rating) runs in worker processes with its own models, so it does not block downloading. All
+        categories are crawled by one run of pipeline, so models are loaded by enrichment processes only once.
+        :param categories: iterable of domain categories, it is read when urls of previous category are crawled
+        :param path: path to url files
+        :param enrich_args: arguments of init_enrich_worker (tagger path, use filter model, use rating model)
+        :param fetch_workers: count of downloading threads
+        :param parse_workers: count of parsing threads
+        :param enrich_workers: count of enrichment processes
+        :param index_workers: count of indexing threads
+        :return:
+        """
+        parsed_products = set()
+        lock = threading.Lock()
+
+        def _urls():
+            for category in categories:
+                try:
+                    for url in self.get_product_urls(category, path):
+                        yield category, url
+                except Exception as e:
+                    print("[task_pipeline] " + category + " " + str(e), file=sys.stderr)
+
+        def _fetch(item: tuple):
+            category, url = item
+            return [(category, url, self.fetcher.fetch(url))]
+
+        def _parse(item: tuple):
+            category, url, content = item
+            product = self.parse_product(url, content, category)
+            if not product:
+                return []
+            # Handle collision
+            with lock:
+                if (category, product.get_name()) in parsed_products:
+                    return []
+                parsed_products.add((category, product.get_name()))
+            return [(self.product_to_dict(product, category), product)]
+
+        def _index(item: tuple):
+            product_dic, reviews, sentences_count, irrelevant_count, empty_count = item
+            return [self.index_product(product_dic, reviews) + (sentences_count, irrelevant_count, empty_count)]
+
+        pipeline = Pipeline([
+            Stage('fetch', _fetch, fetch_workers),
+            Stage('parse', _parse, parse_workers),
+            Stage('enrich', enrich_product, enrich_workers, processes=True, initializer=init_enrich_worker,
+                  initargs=enrich_args),
+            Stage('index', _index, index_workers),
+        ])
+
+        try:
+            for p_n_c, r_n_c_n, rev_cnt, sentences_count, irrelevant_count, empty_count in pipeline.run(_urls()):
+                self.total_review_count += rev_cnt
+                self.total_products_count += 1
+                self.total_product_new_count += p_n_c
+                self.total_review_new_count += r_n_c_n
+                self.sentences_count += sentences_count
+                self.irrelevant_sentences_count += irrelevant_count
+                self.total_empty_reviews += empty_count
+
+        except Exception as e:
+            print("[task_pipeline] " + str(e), file=sys.stderr)
+
+        # index buffered reviews and refresh indexes
+        self.flush_bulk()
+
+    def get_product_urls(self, category: str, path: str):
+        """
+        Stream product urls of category from url store or from url file.
+        :param category: domain category
+        :param path: path to url file
+        :return: generator of urls
+        """
+        def _urls():
+            if self.url_store:
+                for url, _ in self.url_store.iter_products(category):
+                    yield url
+                return
+
+            with open(path + category + ".txt", 'r') as url_file:
+                for line in url_file:
+                    yield line.strip()
+
+        # HeurekaIndex stores urls of listing without scheme
+        for url in _urls():
+            if url.find("https") == -1:
+                url = "https:" + url
+            yield url
+
+    def task(self, category: str, path: str, checkpoint: Checkpoint = None):
         """
         Task for product reviews crawling
         :param path: path to url file
         :param category:
+        :param checkpoint: progress of category, crawling continues from its line (url) and progress is saved to it
         :return:
         """
-        # product list
-        product_reviews = []
+        # names of parsed products
+        product_reviews = set(checkpoint.products) if checkpoint else set()
+        line_offset = checkpoint.line if checkpoint else 0
 
         # statistics
         review_count = 0
@@ -862,40 +1368,20 @@ class HeurekaCrawler:
         product_new_count = 0
         review_new_count_new = 0
         try:
-            with open(path + category + ".txt", 'r') as infile:
-                for line in infile:
+            # skip already crawled urls
+            for urls in batches(islice(self.get_product_urls(category, path), line_offset, None), self.batch_size):
+                # download product pages concurrently
+                for url, content in self.fetcher.fetch_all(urls):
                     try:
-                        url = line.strip()
-                        if url.find("https") == -1:
-                            url = "https:" + url
-
-                        infile = BeautifulSoup(urlopen(url), "lxml")
-                        product = Product(url)
-
-                        product_name = infile.find(class_="item")
-                        if product_name:
-                            product.set_name(
-                                product_name.get_text().strip() + ' (' + url.split(".")[0].split("//")[1] + ')')
-                        # no product name no reviews for that product
-                        else:
+                        if content is None:
+                            raise IOError("Cant open " + url)
+                        product = self.parse_product(url, content, category, product_reviews)
+                        # no product name no reviews for that product or collision
+                        if not product:
                             continue
 
-                        # Handle collision
-                        if product.get_name() in product_reviews:
-                            continue
-
-                        product_category = ""
-
-                        # category list -> category_domain | sub_cat1 | subcat2...
-                        for a in infile.find(id="breadcrumbs").find_all("a")[:-1]:
-                            product_category += a.get_text() + " | "
-                        product.set_category(product_category[:-2])
-
-                        # get reviews
-                        self.parse_product_page(infile, product, category)
-
                         # add product to parsed products
-                        product_reviews.append(product.get_name())
+                        product_reviews.add(product.get_name())
 
                         # add to elastic
                         p_n_c, r_n_c_n, rev_cnt = self.add_to_elastic(product, category)
@@ -913,10 +1399,188 @@ class HeurekaCrawler:
                     except Exception as e:
                         print("[task] Error " + str(e))
 
+                line_offset += len(urls)
+                # save progress, buffered reviews of completed products are indexed first
+                if checkpoint and checkpoint.due():
+                    self.flush_bulk(refresh=False)
+                    checkpoint.save(line_offset, product_reviews)
+
         except Exception as e:
             print("[Task] " + str(e), file=sys.stderr)
 
-    def submit_statistic(self, category: str, review_count: int, products_count: int, product_new_count: int, review_new_count: int):
+        # index buffered reviews and refresh indexes
+        self.flush_bulk()
+        if checkpoint:
+            checkpoint.save(line_offset, product_reviews)
+
+    def task_frontier(self, category: str, frontier: Frontier):
+        """
+        Task for product reviews crawling with crawl frontier. Urls are claimed in batches in order of due (new urls by
+        count of reviews, then urls crawled before recrawl period), so several processes can share one frontier.
+        :param category: domain category
+        :param frontier: crawl frontier
+        :return:
+        """
+        # names of parsed products
+        product_reviews = set()
+
+        try:
+            urls = frontier.claim(category, self.batch_size)
+            while urls:
+                crawled = []
+                failed = []
+                download_urls = {}
+                for url in urls:
+                    download_urls[url if url.find("https") != -1 else "https:" + url] = url
+
+                # download product pages concurrently
+                for url, content in self.fetcher.fetch_all(list(download_urls)):
+                    try:
+                        if content is None:
+                            raise IOError("Cant open " + url)
+                        product = self.parse_product(url, content, category, product_reviews)
+                        crawled.append(download_urls[url])
+                        # no product name no reviews for that product or collision
+                        if not product:
+                            continue
+
+                        product_reviews.add(product.get_name())
+
+                        # add to elastic
+                        p_n_c, r_n_c_n, rev_cnt = self.add_to_elastic(product, category)
+                        self.total_review_count += rev_cnt
+                        self.total_products_count += 1
+                        self.total_review_new_count += r_n_c_n
+                        self.total_product_new_count += p_n_c
+
+                    except IOError:
+                        print("[task_frontier] Error: Cant open URL: ", url, file=sys.stderr)
+                        failed.append(download_urls[url])
+                    except Exception as e:
+                        print("[task_frontier] Error " + str(e), file=sys.stderr)
+                        failed.append(download_urls[url])
+
+                # urls are completed only after their reviews are indexed
+                self.flush_bulk(refresh=False)
+                frontier.complete(crawled)
+                frontier.complete(failed, False)
+
+                urls = frontier.claim(category, self.batch_size)
+
+        except Exception as e:
+            print("[task_frontier] " + str(e), file=sys.stderr)
+
+        # index buffered reviews and refresh indexes
+        self.flush_bulk()
+        print('[task_frontier] {}: {}'.format(category, str(frontier.get_statistic(category))))
+
+    def task_fused(self, category: str):
+        """
+        Task for product reviews crawling fused with indexing of product urls. Domain category is indexed by HeurekaIndex
+        of crawler in background thread, which pushes discovered products to product queue of category, products are
+        downloaded in batches as soon as they are discovered. Queue is bounded, so indexing waits for crawling.
+        :param category: domain category
+        :return:
+        """
+        # names of parsed products
+        product_reviews = set()
+        # products can be listed in several categories
+        seen_urls = set()
+        index = self.heureka_index
+        products = queue.Queue(4 * self.batch_size)
+        index.product_queue = products
+
+        def _index():
+            try:
+                index.task(category, index.category_url[category])
+            finally:
+                # end of indexing
+                products.put(None)
+
+        indexer = threading.Thread(target=_index, daemon=True)
+        indexer.start()
+
+        indexed = False
+        try:
+            while not indexed:
+                urls = []
+                while len(urls) < self.batch_size:
+                    try:
+                        # batch waits only for its first product, the rest is taken from already discovered products
+                        item = products.get() if not urls else products.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        indexed = True
+                        break
+                    url = item[0] if item[0].find("https") != -1 else "https:" + item[0]
+                    if url not in seen_urls:
+                        seen_urls.add(url)
+                        urls.append(url)
+
+                # download product pages concurrently
+                for url, content in self.fetcher.fetch_all(urls):
+                    try:
+                        if content is None:
+                            raise IOError("Cant open " + url)
+                        product = self.parse_product(url, content, category, product_reviews)
+                        # no product name no reviews for that product or collision
+                        if not product:
+                            continue
+
+                        product_reviews.add(product.get_name())
+
+                        # add to elastic
+                        p_n_c, r_n_c_n, rev_cnt = self.add_to_elastic(product, category)
+                        self.total_review_count += rev_cnt
+                        self.total_products_count += 1
+                        self.total_review_new_count += r_n_c_n
+                        self.total_product_new_count += p_n_c
+
+                    except IOError:
+                        print("[task_fused] Error: Cant open URL: ", url, file=sys.stderr)
+                    except Exception as e:
+                        print("[task_fused] Error " + str(e), file=sys.stderr)
+
+        except Exception as e:
+            print("[task_fused] " + str(e), file=sys.stderr)
+
+        # indexing of failed crawling is not blocked by full queue, its products are only written to url store
+        while not indexed:
+            indexed = products.get() is None
+
+        # index buffered reviews and refresh indexes
+        self.flush_bulk()
+        indexer.join()
+        index.product_queue = None
+        print('[task_fused] {}: {}'.format(category, str(index.stats)))
+
+    def get_statistic(self) -> dict:
+        """
+        Get statistics counters of crawler.
+        :return: dict
+        """
+        return {
+            'total_review_count': self.total_review_count,
+            'total_products_count': self.total_products_count,
+            'total_product_new_count': self.total_product_new_count,
+            'total_review_new_count': self.total_review_new_count,
+            'total_empty_reviews': self.total_empty_reviews,
+            'irrelevant_sentences_count': self.irrelevant_sentences_count,
+            'sentences_count': self.sentences_count,
+        }
+
+    def merge_statistic(self, statistic: dict):
+        """
+        Add statistics counters of other crawler (f.e. worker process) to the counters of crawler.
+        :param statistic: dict from get_statistic
+        :return:
+        """
+        for key, value in statistic.items():
+            setattr(self, key, getattr(self, key) + value)
+
+    def submit_statistic(self, category: str, review_count: int, products_count: int, product_new_count: int,
+                         review_new_count: int, watermarks: list = None):
         """
         Index statistics about actualization to the elastic search.
         :param category:
@@ -924,6 +1588,7 @@ class HeurekaCrawler:
         :param products_count:
         :param product_new_count:
         :param review_new_count:
+        :param watermarks: watermarks of subcategories, next actualization of category stops at them
         :return:
         """
         try:
@@ -933,61 +1598,351 @@ class HeurekaCrawler:
                 'affected_products': products_count,
                 'new_products': product_new_count,
                 'new_product_reviews': review_new_count,
-                'date': date.today().strftime("%d. %B %Y").lstrip("0")
+                'date': date.today().strftime("%d. %B %Y").lstrip("0"),
+                'timestamp': time.time()
             }
             print(document)
-            res = self.connector.index(index='actualize_statistic', doc=document)
-            if res['result'] != 'created':
+            if watermarks:
+                document['watermarks'] = watermarks
+            if not self.connector.bulk_index('actualize_statistic', document):
                 print('Statistic for {} was not created'.format(category), file=sys.stderr)
                 print(str(document), file=sys.stderr)
+            # statistic is the last document of task, index buffered documents and refresh indexes
+            self.flush_bulk()
         except Exception as e:
             print("[submit_statistic] Error: Cant open URL: " + str(e), file=sys.stderr)
 
 
+# crawler of enrichment worker process
+enrich_crawler = None
+
+
+def init_enrich_worker(tagger_path: str, use_filter: bool, use_rating: bool):
+    """
+    Initialize crawler with its own models in enrichment worker process of pipeline.
+    :param tagger_path: path to morphodita tagger
+    :param use_filter: use model to filter irrelevant sentences
+    :param use_rating: use model to predict rating of reviews
+    :return:
+    """
+    global enrich_crawler
+    tagger = MorphoTagger()
+    tagger.load_tagger(tagger_path)
+    # every process dumps irrelevant sentences to its own file
+    heureka_filter = HeurekaFilter(use_filter, 'irrelevant_sentences_{}_{}.tsv'.format(
+        date.today().strftime('%d_%m'), os.getpid()))
+    enrich_crawler = HeurekaCrawler(None, tagger, heureka_filter, HeurekaRating(use_rating))
+
+
+def enrich_product(item: tuple):
+    """
+    Enrichment stage of pipeline.
+    :param item: tuple of product document and product object
+    :return: list with tuple of product document, review documents, count of irrelevant sentences and empty reviews
+    """
+    product_dic, product = item
+    return [enrich_crawler.enrich_product(product_dic, product)]
+
+
+def runs_pipeline(args: dict) -> bool:
+    """
+    Check if category task requested by arguments is crawling as pipeline (crawl_category), its models are loaded in
+    enrichment processes.
+    :param args: command line arguments
+    :return:
+    """
+    return bool(args['crawl'] and args['pipeline'] and
+                not (args['actualize'] or args['aspect'] or args['frontier'] or args['fused']))
+
+
+def create_crawler(args: dict, tagger_path: str, use_models: bool = True, filter_log: str = None) -> HeurekaCrawler:
+    """
+    Create crawler with its own tagger, models, elastic connector and page downloader.
+    :param args: command line arguments
+    :param tagger_path: path to morphodita tagger
+    :param use_models: load filter and rating models if they are requested by arguments, False if tasks of process do
+    not use models of crawler
+    :param filter_log: path to log of irrelevant sentences
+    :return: HeurekaCrawler instance
+    """
+    # create tagger
+    tagger = MorphoTagger()
+    tagger.load_tagger(tagger_path)
+
+    # Elastic
+    con = Connector()
+    if args['warm_cache']:
+        print('Cached products: ' + str(con.warm_cache('product')))
+        print('Cached shops: ' + str(con.warm_cache('shop')))
+
+    # Filter model
+    heureka_filter = HeurekaFilter(args['filter'] and use_models, filter_log)
+
+    # Rating model
+    heureka_rating = HeurekaRating(args['rating'] and use_models)
+
+    # Page downloader with shared http session
+    session = HttpSession(pool_maxsize=args['host_concurrency'], read_timeout=args['timeout'])
+    rate_limiter = RateLimiter(args['rate']) if args['rate'] > 0 else None
+    if args['replay']:
+        # pages are served from archive, heureka is not contacted
+        session = ReplaySession(PageArchive(args['replay']))
+        rate_limiter = None
+    elif args['record']:
+        session = RecordingSession(session, PageArchive(args['record'], record=True))
+    fetcher = Fetcher(args['concurrency'], args['host_concurrency'], session=session, rate_limiter=rate_limiter,
+                      max_retries=args['retries'])
+
+    # Local index of existing reviews
+    review_index = ReviewIndex(con, args['dedup']) if args['dedup'] else None
+
+    # Cache of validators of listing pages
+    http_cache = HttpCache(args['http_cache'], session) if args['http_cache'] else None
+
+    # Store of product urls
+    url_store = UrlStore(args['url_store']) if args['url_store'] else None
+
+    # Indexing of product urls of fused crawling, pages are downloaded with rate limited page downloader of crawler
+    heureka_index = None
+    if args['crawl'] and args['fused']:
+        heureka_index = HeurekaIndex(con, session, workers=args['index_threads'], url_store=url_store,
+                                     fetcher=fetcher)
+
+    return HeurekaCrawler(con, tagger, heureka_filter, heureka_rating, fetcher, review_index, http_cache, url_store,
+                          heureka_index)
+
+
+def close_crawler(crawler: HeurekaCrawler):
+    """
+    Persist local caches of crawler, all documents needs to be already indexed and refreshed.
+    :param crawler:
+    :return:
+    """
+    if crawler.review_index:
+        crawler.review_index.save()
+
+    if crawler.http_cache:
+        crawler.http_cache.close()
+
+    if crawler.url_store:
+        crawler.url_store.close()
+
+    # closes page archive of recording or replay
+    crawler.fetcher.session.close()
+
+
+def crawl_category(crawler: HeurekaCrawler, category: str, args: dict, tagger_path: str) -> bool:
+    """
+    Run task requested by arguments on domain category.
+    :param crawler:
+    :param category: domain category
+    :param args: command line arguments
+    :param tagger_path: path to morphodita tagger
+    :return: False if arguments do not request any category task
+    """
+    if args['actualize']:
+        # actualize reviews
+        # always fast for now
+        crawler.task_actualize(category, True, args['stream'])
+
+    elif args['aspect']:
+        # aspect extraction
+        crawler.task_seed_aspect_extraction(category, args['path'])
+    elif args['crawl'] and args['frontier']:
+        # product reviews extraction with crawl frontier
+        frontier = Frontier(args['frontier'])
+        # url dataset of category is merged to frontier
+        if crawler.url_store:
+            frontier.add(list(crawler.url_store.iter_products(category)), category)
+        elif args['path'] and os.path.exists(args['path'] + category + ".txt"):
+            frontier.import_file(args['path'] + category + ".txt", category)
+        crawler.task_frontier(category, frontier)
+        frontier.close()
+    elif args['crawl'] and args['fused']:
+        # product reviews extraction during indexing of product urls to url store
+        crawler.task_fused(category)
+    elif runs_pipeline(args):
+        # product reviews extraction as pipeline
+        crawl_pipeline(crawler, [category], args, tagger_path)
+    elif args['crawl']:
+        # product reviews extraction
+        checkpoint = None
+        if args['checkpoint']:
+            checkpoint = Checkpoint(args['checkpoint'], category)
+            if args['resume']:
+                checkpoint.load()
+        crawler.task(category, args['path'], checkpoint)
+    else:
+        return False
+
+    return True
+
+
+def crawl_pipeline(crawler: HeurekaCrawler, categories, args: dict, tagger_path: str):
+    """
+    Crawl product reviews of domain categories as one pipeline, its enrichment processes are reused for all
+    categories.
+    :param crawler:
+    :param categories: iterable of domain categories
+    :param args: command line arguments
+    :param tagger_path: path to morphodita tagger
+    :return:
+    """
+    crawler.task_pipeline(categories, args['path'], (tagger_path, args['filter'], args['rating']),
+                          args['fetch_workers'], args['parse_workers'], args['enrich_workers'], args['index_workers'])
+
+
+def category_worker(args: dict, tagger_path: str, categories, statistics):
+    """
+    Worker process of parallel crawl, crawls categories from queue with its own crawler and models.
+    :param args: command line arguments
+    :param tagger_path: path to morphodita tagger
+    :param categories: queue of categories, None ends the worker
+    :param statistics: queue to which statistic and snapshot of metrics of worker is put
+    :return:
+    """
+    # every process dumps irrelevant sentences to its own file, worker runs only category tasks
+    crawler = create_crawler(args, tagger_path, not runs_pipeline(args), 'irrelevant_sentences_{}_{}.tsv'.format(
+        date.today().strftime('%d_%m'), os.getpid()))
+
+    if runs_pipeline(args):
+        # one pipeline crawls categories until the end of queue
+        crawl_pipeline(crawler, iter(categories.get, None), args, tagger_path)
+    else:
+        category = categories.get()
+        while category is not None:
+            try:
+                crawl_category(crawler, category, args, tagger_path)
+            except Exception as e:
+                print("[category_worker] Error: " + category + " " + str(e), file=sys.stderr)
+            category = categories.get()
+
+    close_crawler(crawler)
+    statistics.put((crawler.get_statistic(), crawler.metrics.snapshot()))
+
+
+def crawl_parallel(args: dict, tagger_path: str, categories: list, metrics: Metrics = None) -> dict:
+    """
+    Crawl categories in worker processes.
+    :param args: command line arguments
+    :param tagger_path: path to morphodita tagger
+    :param categories: domain categories
+    :param metrics: registry, to which metrics of workers are merged
+    :return: merged statistic of workers
+    """
+    workers_count = min(args['workers'], len(categories))
+    category_queue = mp.Queue()
+    statistic_queue = mp.Queue()
+    for category in categories:
+        category_queue.put(category)
+    for _ in range(workers_count):
+        category_queue.put(None)
+
+    workers = [mp.Process(target=category_worker, args=(args, tagger_path, category_queue, statistic_queue))
+               for _ in range(workers_count)]
+    for w in workers:
+        w.start()
+
+    # workers put only small statistic dictionary, so they can be joined before the queue is read
+    for w in workers:
+        w.join()
+        if w.exitcode != 0:
+            print("[crawl_parallel] Error: worker ended with code " + str(w.exitcode), file=sys.stderr)
+
+    statistic = {}
+    while not statistic_queue.empty():
+        worker_statistic, worker_metrics = statistic_queue.get()
+        for key, value in worker_statistic.items():
+            statistic[key] = statistic.get(key, 0) + value
+        if metrics:
+            metrics.merge(worker_metrics)
+
+    return statistic
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Crawl Heureka reviews as defined in config.py, Expects existence of URLS file for every category")
     parser.add_argument("-actualize", "--actualize", action="store_true", help="Actualize reviews")
     parser.add_argument("-aspect", "--aspect", action="store_true", help="Get aspects from category specification")
     parser.add_argument("-crawl", "--crawl", action="store_true", help="Crawl heureka reviews with url dataset")
+    parser.add_argument("-stream", "-stream", action="store_true",
+                        help="Index actualized products after every round of pages instead of after whole domain")
     parser.add_argument("-path", "-path", help="Path to the dataset folder (ends with /)")
     parser.add_argument("-shop", "-shop", help="Crawl shop reviews", action="store_true")
     parser.add_argument("-filter", "-filter", help="Use model to filter irrelevant sentences", action="store_true")
     parser.add_argument("-rating", "-rating", help="Use model to predict rating of sentences", action="store_true")
     parser.add_argument("-repair", "-repair", help="Repair corrupted product reviews", type=int)
+    parser.add_argument("-concurrency", "-concurrency", help="Maximal count of concurrent requests", type=int,
+                        default=64)
+    parser.add_argument("-host_concurrency", "-host_concurrency", type=int, default=8,
+                        help="Maximal count of concurrent requests to one heureka subdomain")
+    parser.add_argument("-rate", "-rate", type=float, default=8.0,
+                        help="Initial count of requests per second to one heureka subdomain, rate adapts to responses "
+                             "(0 disables limiting)")
+    parser.add_argument("-retries", "-retries", help="Maximal count of retries of throttled or failed request",
+                        type=int, default=3)
+    parser.add_argument("-timeout", "-timeout", help="Read timeout of requests in seconds", type=float, default=30.0)
+    parser.add_argument("-dedup", "-dedup", help="Directory of local index of existing reviews, which is consulted "
+                                                 "before elastic")
+    parser.add_argument("-http_cache", "-http_cache", help="Path to database of validators of listing pages, that "
+                                                           "are downloaded with conditional requests in actualization")
+    parser.add_argument("-checkpoint", "-checkpoint", help="Directory of progress of crawling with url dataset, that "
+                                                           "is saved regularly")
+    parser.add_argument("-resume", "-resume", action="store_true",
+                        help="Resume crawling with url dataset from saved progress (requires -checkpoint)")
+    parser.add_argument("-frontier", "-frontier", help="Path to sqlite crawl frontier of product urls (heureka_index "
+                                                       "-frontier), urls are crawled by priority")
+    parser.add_argument("-url_store", "-url_store", help="Path to sqlite store of product urls (heureka_index "
+                                                         "-url_store), which is read instead of url files")
+    parser.add_argument("-warm_cache", "-warm_cache", action="store_true",
+                        help="Load names of all products and shops to cache before crawling")
+    parser.add_argument("-record", "-record", help="Directory of page archive, to which all downloaded pages are "
+                                                   "appended")
+    parser.add_argument("-replay", "-replay", help="Directory of page archive, from which pages are served instead of "
+                                                   "heureka")
+    parser.add_argument("-metrics", "-metrics", help="Path (without extension) of metrics of run, that are written as "
+                                                     "Prometheus text file (.prom) and json summary (.json)")
+    parser.add_argument("-workers", "-workers", type=int, default=1,
+                        help="Count of worker processes, that crawl categories in parallel")
+    parser.add_argument("-fused", "-fused", action="store_true",
+                        help="Crawl reviews of products as soon as heureka_index discovers them, discovered products "
+                             "are written to url store (requires -url_store)")
+    parser.add_argument("-index_threads", "-index_threads", type=int, default=16,
+                        help="Count of threads of fused crawling, that download and parse category pages")
+    parser.add_argument("-pipeline", "-pipeline", action="store_true",
+                        help="Crawl reviews with url dataset as pipeline fetch -> parse -> enrich -> index")
+    parser.add_argument("-fetch_workers", "-fetch_workers", help="Count of downloading threads of pipeline", type=int,
+                        default=16)
+    parser.add_argument("-parse_workers", "-parse_workers", help="Count of parsing threads of pipeline", type=int,
+                        default=4)
+    parser.add_argument("-enrich_workers", "-enrich_workers", help="Count of enrichment processes of pipeline",
+                        type=int, default=mp.cpu_count())
+    parser.add_argument("-index_workers", "-index_workers", help="Count of indexing threads of pipeline", type=int,
+                        default=2)
 
     args = vars(parser.parse_args())
-
-    # create tagger
-    tagger = MorphoTagger()
-    tagger.load_tagger("../model/czech-morfflex-pdt-161115-no_dia-pos_only.tagger")
-
-    # Elastic
-    con = Connector()
-
-    # Filter model
-    heureka_filter = HeurekaFilter(args['filter'] )
-
-    # Rating model
-    heureka_rating = HeurekaRating(args['rating'])
-
-    # Crawler
-    crawler = HeurekaCrawler(con, tagger, heureka_filter, heureka_rating)
-
-    for category in crawler.categories:
-        if args['actualize']:
-            # actualize reviews
-            # always fast for now
-            crawler.task_actualize(category, True)
-
-        elif args['aspect']:
-            # aspect extraction
-            crawler.task_seed_aspect_extraction(category, args['path'])
-        elif args['crawl']:
-            # product reviews extraction
-            crawler.task(category, args['path'])
-        else:
-            break
+    # url files of working directory are not overwritten by fused crawling
+    if args['fused'] and not args['url_store']:
+        parser.error("-fused requires -url_store")
+
+    tagger_path = "../model/czech-morfflex-pdt-161115-no_dia-pos_only.tagger"
+
+    parallel = args['workers'] > 1 and (args['actualize'] or args['aspect'] or args['crawl'])
+    # models of main process are needed only for tasks, that are not run by workers or by pipeline
+    crawler = create_crawler(args, tagger_path, bool(args['shop'] or args['repair']) or
+                             not (parallel or runs_pipeline(args)))
+
+    if parallel:
+        # categories are crawled by worker processes
+        crawler.merge_statistic(crawl_parallel(args, tagger_path, crawler.categories, crawler.metrics))
+    elif runs_pipeline(args):
+        # categories are crawled by one pipeline
+        crawl_pipeline(crawler, crawler.categories, args, tagger_path)
+    else:
+        for category in crawler.categories:
+            if not crawl_category(crawler, category, args, tagger_path):
+                break
 
     if args['shop']:
         # crawl shop reviews
@@ -1006,6 +1961,14 @@ def main():
         print('Irrelevant sentences : ' + str(crawler.irrelevant_sentences_count))
         print('Total sentences : ' + str(crawler.sentences_count))
 
+    close_crawler(crawler)
+
+    if args['metrics']:
+        # final counters of crawler are exported with metrics of stages
+        for key, value in crawler.get_statistic().items():
+            crawler.metrics.inc(key, value)
+        crawler.metrics.write(args['metrics'])
+
 
 if __name__ == '__main__':
     start = time.time()
@@ -1,35 +1,45 @@
 """
 This file contains implementation Files class for handling of dumped product urls during indexing of products
-from heureka, Statistics class that holds information of crawling and HeurekaIndex class, that implements product
-indexing of heureka.
+from heureka, Statistics class that holds information of crawling, ReviewCountCache class that persists review counts
+of fashion products and HeurekaIndex class, that implements product indexing of heureka.
 
 Author: xkloco00@stud.fit.vutbr.cz
 """
 
-import argparse, time, sys, json, os
-from urllib.request import urlopen
-from bs4 import BeautifulSoup
+import argparse, time, sys, json, os, threading, queue, sqlite3
 
 sys.path.append('../')
 from utils.elastic_connector import Connector
+from utils.http_session import HttpSession
+from utils.fetcher import Fetcher
+from utils.rate_limiter import RateLimiter
+from utils.url_store import UrlStore
+from utils.frontier import Frontier
+from utils.page_archive import PageArchive, RecordingSession, ReplaySession
+from utils.extractor import parse_html, extract_next_page, extract_categories, extract_listing, \
+    extract_fashion_products, extract_fashion_review_count
 from collections import OrderedDict
 
 
 class Files:
     """
-    Class handles file operations with output of HeurekaIndex class.
+    Class handles file operations with output of HeurekaIndex class. With url store urls are written to the store
+    instead of text files.
     """
 
-    def __init__(self, category: str):
+    def __init__(self, category: str, store: UrlStore = None):
         """
         Initialize structure of logging files.
         :param category: the name of category
+        :param store: deduplicated url store, which replaces text files
         """
         self.category = category
+        self.store = store
         self.url_no_rev = None
         self.url_log = None
         self.url_file = None
         self.crawled_categories = None
+        self.lock = threading.Lock()
 
     def __open(self, mode: str):
         """
@@ -43,24 +53,78 @@ class Files:
 
     def open_write(self):
         """
-        Open files in write mode.
+        Open files in write mode, resume markers of url store are removed.
         :return:
         """
-        self.__open("w")
+        if self.store:
+            self.store.reset_done(self.category)
+        else:
+            self.__open("w")
 
     def open_append(self):
         """
-        Open files in append mode and get domain categories.
+        Open files in append mode and get domain categories, url store resumes with its markers.
         :return:
         """
+        if self.store:
+            return
         self.crawled_categories = self.get_crawled_categories()
         self.__open("a")
 
+    def write_url(self, url: str, review_count: int):
+        """
+        Write url of product with reviews, method is thread safe.
+        :param url:
+        :param review_count: count of reviews of product
+        :return:
+        """
+        if self.store:
+            self.store.add(url, self.category, review_count)
+            return
+        with self.lock:
+            self.url_file.write(url + "\n")
+
+    def write_no_rev(self, url: str):
+        """
+        Write url of product without reviews, method is thread safe.
+        :param url:
+        :return:
+        """
+        if self.store:
+            self.store.add(url, self.category)
+            return
+        with self.lock:
+            self.url_no_rev.write(url + "\n")
+
+    def is_crawled(self, url: str) -> bool:
+        """
+        Check if category was already indexed by interrupted indexing.
+        :param url: url of category
+        :return:
+        """
+        if self.store:
+            return self.store.is_done(self.category, url)
+        if self.crawled_categories:
+            return url.split("//")[1].split(".")[0] in self.crawled_categories
+        return False
+
+    def mark_crawled(self, url: str):
+        """
+        Mark category with all its pages as indexed, text files are resumed by their content.
+        :param url: url of category
+        :return:
+        """
+        if self.store:
+            self.store.mark_done(self.category, url)
+
     def close(self):
         """
         Close opened files.
         :return:
         """
+        if self.store:
+            self.store.commit()
+            return
         self.url_file.close()
         self.url_no_rev.close()
         self.url_log.close()
@@ -107,28 +171,31 @@ class Statistics:
         self.reviews_count = 0
         self.reviews_reachable = 0
         self.products_count = 0
+        self.lock = threading.Lock()
 
     def merge(self, stats):
         """
-        Merge category statistics.
+        Merge category statistics, method is thread safe.
         :param stats:
         :return:
         """
-        self.reviews_count += stats.reviews_count
-        self.reviews_reachable += stats.reviews_reachable
-        self.products_count += stats.products_count
+        with self.lock:
+            self.reviews_count += stats.reviews_count
+            self.reviews_reachable += stats.reviews_reachable
+            self.products_count += stats.products_count
 
     def add(self, reviews_count: int = 0, reviews_reachable: int = 0, products_count: int = 0):
         """
-        Add statistics to class variables.
+        Add statistics to class variables, method is thread safe.
         :param reviews_count: count of all product reviews
         :param reviews_reachable: count ouf reachable product reviews
         :param products_count: count of products
         :return:
         """
-        self.reviews_count += reviews_count
-        self.reviews_reachable += reviews_reachable
-        self.products_count += products_count
+        with self.lock:
+            self.reviews_count += reviews_count
+            self.reviews_reachable += reviews_reachable
+            self.products_count += products_count
 
     def __str__(self):
         """
@@ -142,11 +209,74 @@ class Statistics:
         }, indent=2)
 
 
+class ReviewCountCache:
+    """
+    Class persists review counts of fashion products in sqlite database, so product pages are not downloaded again
+    during next indexing.
+    """
+    def __init__(self, path: str, max_age: float = 30 * 24 * 3600):
+        """
+        Open (or create) cache database.
+        :param path: path to sqlite database
+        :param max_age: count of seconds after which cached review count is downloaded again
+        """
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS product (url TEXT PRIMARY KEY, review_count INTEGER, '
+                        'updated REAL)')
+        self.db.commit()
+
+    def get_many(self, urls: list) -> dict:
+        """
+        Get cached review counts of urls.
+        :param urls: list of urls
+        :return: dict of url to count of reviews, unknown and expired urls are missing
+        """
+        if not urls:
+            return {}
+        with self.lock:
+            rows = self.db.execute('SELECT url, review_count FROM product WHERE updated > ? AND url IN ({})'.format(
+                ','.join('?' * len(urls))), [time.time() - self.max_age] + list(urls)).fetchall()
+        return dict(rows)
+
+    def put_many(self, counts: dict):
+        """
+        Save review counts.
+        :param counts: dict of url to count of reviews
+        :return:
+        """
+        now = time.time()
+        with self.lock:
+            self.db.executemany('INSERT OR REPLACE INTO product (url, review_count, updated) VALUES (?, ?, ?)',
+                                [(url, count, now) for url, count in counts.items()])
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
 class HeurekaIndex:
     """
     Class handles product url indexing from heureka to txt files.
     """
-    def __init__(self, connector):
+    def __init__(self, connector, session: HttpSession = None, frontier: Frontier = None, workers: int = 16,
+                 fashion_concurrency: int = 16, review_count_cache: ReviewCountCache = None,
+                 url_store: UrlStore = None, product_queue: queue.Queue = None, fetcher: Fetcher = None):
+        """
+        Constructor initializes domain urls and shared http session.
+        :param connector: Elastic search connector with API methods
+        :param session: http session with pooled connections
+        :param frontier: crawl frontier, which receives product urls with count of reviews besides url file
+        :param workers: count of threads, that download and parse category pages concurrently
+        :param fashion_concurrency: maximal count of concurrent downloads of fashion product pages
+        :param review_count_cache: persistent cache of review counts of fashion products
+        :param url_store: deduplicated store of product urls, which replaces url text files
+        :param product_queue: queue, which receives product urls with count of reviews as soon as they are discovered
+        (crawling fused with indexing)
+        :param fetcher: page downloader (rate limiting, retries) of category and product pages, default downloader
+        without rate limiting uses session and fashion_concurrency
+        """
         self.category_url = OrderedDict([
             ('Elektronika', 'https://elektronika.heureka.cz/'),
             ('Bile zbozi', 'https://bile-zbozi.heureka.cz/'),
@@ -165,40 +295,49 @@ class HeurekaIndex:
         ])
 
         self.connector = connector
+        self.session = session if session else HttpSession()
+        self.frontier = frontier
+        self.workers = workers
+        # pages of all category workers share rate limiter and limits of concurrency
+        self.fetcher = fetcher if fetcher else Fetcher(fashion_concurrency, fashion_concurrency, session=self.session)
+        self.review_count_cache = review_count_cache
+        self.url_store = url_store
+        self.product_queue = product_queue
         self.stats = Statistics()
 
-    def parse_product(self, product, files: Files, stats: Statistics):
+    def parse_product(self, product: dict, files: Files, stats: Statistics):
         """
          Write product to url file and save meta data to stats.
-        :param product: BeautifulSoup instance
+        :param product: product record of category listing (extract_listing)
         :param files: Files instance
         :param stats: Statistics instance
-        :return:
+        :return: tuple (url, count of reviews) or None if product does not have any reviews
         """
-        prod: BeautifulSoup = product.find(class_="review-count")
         # if product does not have any reviews
-        if not prod:
-            files.url_no_rev.write(product.find("a").get("href") + "\n")
+        if not product['review_count']:
+            files.write_no_rev(product['url'])
+            return None
         # other way write product and save meta data
         else:
-            files.url_file.write(prod.find("a").get("href") + "\n")
-
-            rev_count = int(prod.get_text().split()[0])
+            rev_count = int(product['review_count'].split()[0])
+            files.write_url(product['review_url'], rev_count)
+            if self.product_queue:
+                self.product_queue.put((product['review_url'], rev_count))
 
             if rev_count > 500:
                 stats.add(reviews_count=rev_count, reviews_reachable=500, products_count=1)
             else:
                 stats.add(reviews_count=rev_count, reviews_reachable=rev_count, products_count=1)
 
-    def parse_fashion_product(self, product, files: Files, stats: Statistics):
+            return product['review_url'], rev_count
+
+    @staticmethod
+    def fashion_review_url(href: str) -> str:
         """
-        Write fashion product to url file and save meta data to stats.
-        :param product: BeautifulSoup instance
-        :param files: Files instance
-        :param stats: Statistics instance
-        :return:
+        Get url of reviews of fashion product.
+        :param href: url of product (extract_fashion_products)
+        :return: url
         """
-        href: str = product.find(class_="image").find("a").get("href")
         if href[-1] != "/":
             href += "/"
 
@@ -206,119 +345,195 @@ class HeurekaIndex:
 
         if href.find("https") == -1:
             href = "https:" + href
-        prod: BeautifulSoup = BeautifulSoup(urlopen(href), "lxml")
-        rev: BeautifulSoup = prod.find(class_="review-count delimiter-blank")
+        return href
 
-        if not rev:
-            files.url_no_rev.write(href + "\n")
+    def resolve_fashion_review_counts(self, urls: list) -> dict:
+        """
+        Get review counts of fashion products, cached counts are used and the rest of product pages is downloaded
+        concurrently.
+        :param urls: urls of reviews of fashion products (fashion_review_url)
+        :return: dict of url to count of reviews (0 if product does not have any reviews), urls that could not be
+        resolved are missing
+        """
+        counts = self.review_count_cache.get_many(urls) if self.review_count_cache else {}
+        resolved = {}
+        for url, content in self.fetcher.fetch_all([url for url in urls if url not in counts]):
+            try:
+                if content is None:
+                    raise IOError("Cant open " + url)
+                rev = extract_fashion_review_count(parse_html(content))
+                resolved[url] = int(rev) if rev else 0
+            except Exception as e:
+                print("[parse_domain] Error in product " + str(url), file=sys.stderr)
+
+        if self.review_count_cache and resolved:
+            self.review_count_cache.put_many(resolved)
+        counts.update(resolved)
+        return counts
+
+    def parse_fashion_product(self, href: str, rev_count: int, files: Files, stats: Statistics):
+        """
+        Write fashion product to url file and save meta data to stats.
+        :param href: url of reviews of product (fashion_review_url)
+        :param rev_count: count of reviews of product (resolve_fashion_review_counts)
+        :param files: Files instance
+        :param stats: Statistics instance
+        :return: tuple (url, count of reviews) or None if product does not have any reviews
+        """
+        if not rev_count:
+            files.write_no_rev(href)
+            return None
 
         else:
-            files.url_file.write(href + "\n")
+            files.write_url(href, rev_count)
+            if self.product_queue:
+                self.product_queue.put((href, rev_count))
 
-            rev_count = int(rev.find("span").get_text())
             if rev_count > 500:
                 stats.add(reviews_count=rev_count, reviews_reachable=500, products_count=1)
             else:
                 stats.add(reviews_count=rev_count, reviews_reachable=rev_count, products_count=1)
 
-    def parse_domain(self, catlist: BeautifulSoup, files: Files, main_category: str, stats: Statistics):
+            return href, rev_count
+
+    def parse_domain(self, categories: list, files: Files, main_category: str, stats: Statistics):
         """
-        Recursively parse domain category for product urls
-        :param catlist: html
+        Parse domain category for product urls. Category pages are processed from shared work queue by pool of threads,
+        next page of category and subcategories of category without pagination are put back to the queue.
+        :param categories: urls of subcategories (extract_categories)
         :param files:   Files instance
         :param main_category: domain name
         :param stats: Statistics instance
         :return:
         """
-        def _parse_category():
+        def _parse_category(infile):
             """
             Parse concrete product according to name of the main category
+            :param infile: parsed category page
             :return:
             """
+            urls = []
             if main_category == "Obleceni a moda":
-                products = infile.find_all(class_="p")
-                for product in products:
+                hrefs = []
+                for href in extract_fashion_products(infile):
                     try:
-                        self.parse_fashion_product(product, files, item_stats)
+                        hrefs.append(self.fashion_review_url(href))
                     except Exception as e:
-                        print(
-                            "[parse_domain] Error in product " + product.find(class_="image").find(
-                                "a").get("href"),
-                            file=sys.stderr)
-                        pass
+                        print("[parse_domain] Error in product " + str(href), file=sys.stderr)
+                # review counts of all products of page are resolved at once
+                rev_counts = self.resolve_fashion_review_counts(hrefs)
+                for href in hrefs:
+                    if href in rev_counts:
+                        urls.append(self.parse_fashion_product(href, rev_counts[href], files, stats))
             else:
-                products = infile.find_all(class_="rw")
-                for product in products:
+                for product in extract_listing(infile):
                     try:
-                        self.parse_product(product, files, item_stats)
+                        urls.append(self.parse_product(product, files, stats))
                     except Exception as e:
-                        print("[parse_domain] Error in product " + product.find("a").get("href"),
-                              file=sys.stderr)
+                        print("[parse_domain] Error in product " + str(product['url']), file=sys.stderr)
                         pass
 
-        for cat in catlist:
-            li = cat.find_all("li")
-            # crawl categories
-            for item in li:
-                # element strong indicates number of reviews per category
-                if not item.find("strong"):
-                    continue
-
-                item_stats: Statistics = Statistics()
-                category = item.find("a").get("href")
-
-                # already analyzed category
-                if files.crawled_categories:
-                    tmp = category.split("//")[1].split(".")[0]
-                    if tmp in files.crawled_categories:
-                        print("Already analyzed: " + tmp)
-                        continue
+            # products of whole listing page are added to frontier in one transaction
+            if self.frontier:
+                self.frontier.add([url for url in urls if url], main_category)
+
+        def _add_category(category: str):
+            """
+            Put the first page of category to the queue.
+            :param category: url of category
+            :return:
+            """
+            # already analyzed category
+            if files.is_crawled(category):
+                print("Already analyzed: " + category)
+                return
 
-                next = " "
+            work.put((category, " "))
 
-                while next:
-                    try:
-                        infile = BeautifulSoup(urlopen(category + next), "lxml")
-                        _parse_category()
-                        next = infile.find(class_="butt")
-                        if next:
-                            next = next.find("a", "next").get("href")
-                        else:
-                            # Fasion has already final subcategories
-                            if category != "Obleceni a moda":
-                                catlist = infile.find_all(class_="catlist")
-                                self.parse_domain(catlist, files, main_category, item_stats)
-                    except Exception as e:
-                        print("[parse_domain] Cant open " + category + next, file=sys.stderr)
-                        break
+        def _worker():
+            """
+            Process category pages from the queue until None is received.
+            :return:
+            """
+            while True:
+                item = work.get()
+                if item is None:
+                    work.task_done()
+                    return
 
-                stats.merge(item_stats)
+                category, next = item
+                try:
+                    infile = parse_html(self.fetcher.fetch(category + next))
+                    _parse_category(infile)
+                    next = extract_next_page(infile, "butt")
+                    if next:
+                        work.put((category, next))
+                        continue
 
-    def task(self, category: str, url: str):
+                    subcategories = []
+                    # page without next page lists subcategories
+                    # Fasion has already final subcategories
+                    if category != "Obleceni a moda":
+                        subcategories = extract_categories(infile, "catlist")
+                        for subcategory in subcategories:
+                            try:
+                                _add_category(subcategory)
+                            except Exception as e:
+                                print("[parse_domain] Error in category " + str(subcategory), file=sys.stderr)
+                    # category with subcategories is indexed again on resume, so its subcategories are visited
+                    if not subcategories:
+                        files.mark_crawled(category)
+                except Exception as e:
+                    print("[parse_domain] Cant open " + category + str(next), file=sys.stderr)
+                finally:
+                    work.task_done()
+
+        # queue of tuples (category url, reference of page), only categories with count of reviews are listed
+        work = queue.Queue()
+        for category in categories:
+            _add_category(category)
+
+        threads = [threading.Thread(target=_worker, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        # wait until all pages, including the ones added by workers, are processed
+        work.join()
+        for _ in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+
+    def task(self, category: str, url: str, resume: bool = False):
         """
         Start crawling from domain category with starting point as url
         :param category: domain name
         :param url: url to heureka
+        :param resume: skip categories indexed by interrupted run
         :return:
         """
         # statistics instance
         stats = Statistics()
         #  initialize files
         try:
-            f = Files(category)
-            f.open_write()
+            f = Files(category, self.url_store)
+            # text files of category, which was not indexed yet, are not resumed
+            if resume and (self.url_store or os.path.exists(category + ".txt")):
+                f.open_append()
+            else:
+                f.open_write()
 
         except IOError:
             print("Cant open files for category: " + category, file=sys.stderr)
             return
         # parse domain for product urls
         try:
-            infile = BeautifulSoup(urlopen(url), "lxml")
+            infile = parse_html(self.fetcher.fetch(url))
             # fashion has different style as the rest
             if category == "Obleceni a moda":
-                category_list = infile.find_all(class_="cat-list")
+                category_list = extract_categories(infile, "cat-list")
             else:
-                category_list = infile.find_all(class_="catlist")
+                category_list = extract_categories(infile, "catlist")
             # parse
             self.parse_domain(category_list, f, category, stats)
             # merge statistics
@@ -334,19 +549,65 @@ class HeurekaIndex:
 
 def main():
     parser = argparse.ArgumentParser(description="Crawl Heureka product urls")
+    parser.add_argument("-frontier", help="Path to sqlite crawl frontier, which receives product urls")
+    parser.add_argument("-workers", type=int, default=16,
+                        help="Count of threads, that download and parse category pages concurrently")
+    parser.add_argument("-fashion_concurrency", type=int, default=16,
+                        help="Maximal count of concurrent downloads of fashion product pages")
+    parser.add_argument("-fashion_cache", help="Path to sqlite cache of review counts of fashion products")
+    parser.add_argument("-rate", type=float, default=8.0,
+                        help="Initial count of requests per second to one heureka subdomain, rate adapts to responses "
+                             "(0 disables limiting)")
+    parser.add_argument("-retries", type=int, default=3, help="Maximal count of retries of throttled or failed request")
+    parser.add_argument("-url_store", help="Path to sqlite store of product urls, which replaces url text files")
+    parser.add_argument("-resume", action="store_true", help="Resume interrupted indexing")
+    parser.add_argument("-record", help="Directory of page archive, to which all downloaded pages are appended")
+    parser.add_argument("-replay", help="Directory of page archive, from which pages are served instead of heureka")
     args = vars(parser.parse_args())
 
     # Elastic
     con = Connector()
 
+    # Shared http session
+    session = HttpSession(pool_maxsize=max(args['workers'], args['fashion_concurrency']))
+    rate_limiter = RateLimiter(args['rate']) if args['rate'] > 0 else None
+    if args['replay']:
+        # pages are served from archive, heureka is not contacted
+        session = ReplaySession(PageArchive(args['replay']))
+        rate_limiter = None
+    elif args['record']:
+        session = RecordingSession(session, PageArchive(args['record'], record=True))
+
+    # Page downloader of category and product pages
+    fetcher = Fetcher(args['fashion_concurrency'], args['fashion_concurrency'], session=session,
+                      rate_limiter=rate_limiter, max_retries=args['retries'])
+
+    # Crawl frontier
+    frontier = Frontier(args['frontier']) if args['frontier'] else None
+
+    # Review counts of fashion products
+    review_count_cache = ReviewCountCache(args['fashion_cache']) if args['fashion_cache'] else None
+
+    # Store of product urls
+    url_store = UrlStore(args['url_store']) if args['url_store'] else None
+
     # Crawler
-    heureka_index = HeurekaIndex(con)
+    heureka_index = HeurekaIndex(con, session, frontier, args['workers'], args['fashion_concurrency'],
+                                 review_count_cache, url_store, fetcher=fetcher)
 
     for category, url in heureka_index.category_url.items():
-        heureka_index.task(category, url)
+        heureka_index.task(category, url, args['resume'])
 
     print(heureka_index.stats)
 
+    if frontier:
+        frontier.close()
+    if review_count_cache:
+        review_count_cache.close()
+    if url_store:
+        url_store.close()
+    session.close()
+
 
 if __name__ == '__main__':
     start = time.time()
@@ -16,10 +16,11 @@ class HeurekaFilter:
     Class handles filtering of irrelevant sentences with creation of new dataset irrelevant_sentences.tsv. To this
     dataset all irrelevant sentences, that are longer than one word are written.
     """
-    def __init__(self, useCls: bool):
+    def __init__(self, useCls: bool, log_path: str = None):
         """
         Constructor loads irrelevant classifier model and opens file for dumping irrelevant sentences.
         :param useCls:
+        :param log_path: path of file for dumping irrelevant sentences, by default name contains today's date
         """
         self.model = None
         if useCls:
@@ -37,7 +38,9 @@ class HeurekaFilter:
             # last read row
             self.index = int(row[0])
 
-            self.log_file = open('irrelevant_sentences_'+ date.today().strftime('%d_%m')+'.tsv', "w")
+            if not log_path:
+                log_path = 'irrelevant_sentences_' + date.today().strftime('%d_%m') + '.tsv'
+            self.log_file = open(log_path, "w")
 
         except Exception as e:
             print('[HeurekaFilter] Exception: ' + str(e))
@@ -64,6 +67,29 @@ class HeurekaFilter:
 
         return False
 
+    def is_irrelevant_batch(self, sentences: list) -> list:
+        """
+        Evaluate list of sentences (f.e. all sentences of page) with one call of SVM classifier.
+        :param sentences:
+        :return: list of bool in order of sentences
+        """
+        # one word sentences are irrelevant
+        irrelevant = [len(sentence.split()) <= 1 for sentence in sentences]
+
+        # evaluate other sentences with trained model, if we use one
+        if self.model:
+            indexes = [i for i, value in enumerate(irrelevant) if not value]
+            labels = self.model.eval_examples([sentences[i] for i in indexes])
+            for i, label in zip(indexes, labels):
+                if label == 'irrelevant':
+                    irrelevant[i] = True
+                    if self.log_file:
+                        # dump sentence
+                        self.index += 1
+                        self.log_file.write('{0}\t0\ta\t{1}\n'.format(str(self.index), sentences[i]))
+
+        return irrelevant
+
     def __del__(self):
         """
         Destructor method closes opened file for dumping irrelevant sentences.
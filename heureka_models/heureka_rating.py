@@ -69,6 +69,24 @@ class HeurekaRating:
             print("[eval_sentence] Error: " + str(e), file=sys.stderr)
             return ''
 
+    def eval_sentences(self, sentences: list, batch_size: int = 32) -> list:
+        """
+        Perform evaluation of sentences with Bert regression model in mini-batches.
+        :param sentences: list of texts
+        :param batch_size: count of sentences in one forward pass of model
+        :return: list of string percentage representations of rating, empty string if sentence was not evaluated
+        """
+        try:
+            if self.regression_model and sentences:
+                examples = [('a', self.__clear_sentence(sentence)) for sentence in sentences]
+                ratings = self.regression_model.eval_examples(examples, False, batch_size)
+                return ['{}%'.format(self.__round_percentage(rating)) for rating in ratings]
+
+        except Exception as e:
+            print("[eval_sentences] Error: " + str(e), file=sys.stderr)
+
+        return [''] * len(sentences)
+
     def merge_review_text(self, pos: list, con: list, summary: str):
         """
         Merge review sentences to one text string.
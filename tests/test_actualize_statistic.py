@@ -0,0 +1,137 @@
+"""
+This file contains tests of statistics of actualization (HeurekaCrawler.task_actualize), documents that fail in bulk
+are subtracted from statistics of category and from total statistics of crawler exactly once.
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+
+import unittest
+from utils.elastic_connector import CREATED, FAILED
+from heureka_crawler import HeurekaCrawler
+
+
+class BulkConnector:
+    """
+    Connector, which buffers documents and fails documents with 'fail' key at flush.
+    """
+    def __init__(self, existing_products=()):
+        self.existing_products = set(existing_products)
+        self.domain = {}
+        self.buffer = []
+        self.statistics = []
+        self.failed_count = 0
+
+    def warm_category_cache(self):
+        return 0
+
+    def get_actualization_watermarks(self, category):
+        return {}
+
+    def get_bulk_failed_count(self):
+        return self.failed_count
+
+    def get_product_by_name(self, name):
+        return {'product_name': name} if name in self.existing_products else None
+
+    def bulk_index(self, index, doc, doc_id=None, op_type='index', callback=None):
+        if index == 'actualize_statistic':
+            self.statistics.append(doc)
+        self.buffer.append((doc, callback))
+        return True
+
+    def flush_bulk(self, refresh=True):
+        for doc, callback in self.buffer:
+            self.failed_count += 1 if doc.get('fail') else 0
+            if callback:
+                callback(FAILED if doc.get('fail') else CREATED)
+        self.buffer = []
+        return []
+
+
+class HttpCache:
+    """
+    Cache of validators, which records whether validators of downloaded pages were committed.
+    """
+    def __init__(self):
+        self.committed = None
+
+    def commit(self):
+        self.committed = True
+
+    def discard(self):
+        self.committed = False
+
+
+class Product:
+    """
+    Actualized product with documents of product and reviews.
+    """
+    def __init__(self, name, reviews):
+        self.doc = {'product_name': name, 'domain': 'elektronika'}
+        self.reviews = reviews
+
+    def get_name(self):
+        return self.doc['product_name']
+
+
+def review(author, fail=False):
+    rev_dic = {'author': author, 'date_str': '1. ledna 2021'}
+    if fail:
+        rev_dic['fail'] = True
+    return rev_dic
+
+
+class TestActualizeStatistic(unittest.TestCase):
+
+    def actualize(self, products: list) -> (BulkConnector, HeurekaCrawler):
+        """
+        Actualize category, in which actualized products were found.
+        :param products: list of Product
+        :return: connector and crawler after actualization
+        """
+        connector = BulkConnector(existing_products=['old'])
+        crawler = HeurekaCrawler(connector, None, None, None, http_cache=HttpCache())
+
+        def actualize_reviews(obj_product_dict, category_domain, fast, watermarks=None, emit=None):
+            watermarks['https://mobilni-telefony.heureka.cz/'] = {'url': 'https://mobilni-telefony.heureka.cz/'}
+            for product in products:
+                obj_product_dict[product.get_name()] = product
+
+        crawler.actualize_reviews = actualize_reviews
+        crawler.add_to_elastic = lambda product, category: crawler.index_product(product.doc, product.reviews)
+        crawler.task_actualize('Elektronika', False)
+        return connector, crawler
+
+    def test_failed_documents(self):
+        connector, crawler = self.actualize([
+            Product('new', [review('a'), review('b', fail=True)]),
+            Product('old', [review('c'), review('d', fail=True)]),
+        ])
+
+        statistic, = connector.statistics
+        self.assertEqual(statistic['review_count'], 2)
+        self.assertEqual(statistic['affected_products'], 2)
+        self.assertEqual(statistic['new_products'], 1)
+        self.assertEqual(statistic['new_product_reviews'], 1)
+
+        total = crawler.get_statistic()
+        self.assertEqual(total['total_review_count'], 2)
+        self.assertEqual(total['total_products_count'], 2)
+        self.assertEqual(total['total_product_new_count'], 1)
+        self.assertEqual(total['total_review_new_count'], 1)
+
+    def test_watermarks(self):
+        connector, crawler = self.actualize([Product('old', [review('a')])])
+        statistic, = connector.statistics
+        self.assertEqual(statistic['watermarks'], [{'url': 'https://mobilni-telefony.heureka.cz/'}])
+        self.assertTrue(crawler.http_cache.committed)
+
+        # failed review is not behind watermark or cached page, so it is found again by the next actualization
+        connector, crawler = self.actualize([Product('old', [review('a'), review('b', fail=True)])])
+        statistic, = connector.statistics
+        self.assertNotIn('watermarks', statistic)
+        self.assertFalse(crawler.http_cache.committed)
+
+
+if __name__ == '__main__':
+    unittest.main()
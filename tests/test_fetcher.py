@@ -0,0 +1,60 @@
+"""
+This file contains tests of Fetcher, limit of concurrent requests to host is shared by all threads using the fetcher
+(f.e. category workers of HeurekaIndex resolving review counts of fashion products).
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+
+import threading, time, unittest
+from utils.fetcher import Fetcher
+
+
+class InFlightCounter:
+    """
+    Blocking download function, which records maximal count of concurrent requests.
+    """
+    def __init__(self, duration: float = 0.02):
+        self.duration = duration
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def get(self, url: str) -> bytes:
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.duration)
+        with self.lock:
+            self.in_flight -= 1
+        return url.encode('utf-8')
+
+
+class TestFetcher(unittest.TestCase):
+
+    def test_host_limit_of_concurrent_callers(self):
+        counter = InFlightCounter()
+        fetcher = Fetcher(max_concurrency=16, host_concurrency=2)
+        fetcher.get = counter.get
+        urls = ['https://obleceni.heureka.cz/{}/'.format(i) for i in range(8)]
+        results = []
+
+        def _fetch_all():
+            results.append(fetcher.fetch_all(urls, counter.get))
+
+        def _fetch():
+            results.append([(url, fetcher.fetch(url)) for url in urls])
+
+        callers = [threading.Thread(target=_fetch_all), threading.Thread(target=_fetch_all),
+                   threading.Thread(target=_fetch)]
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+
+        self.assertEqual(counter.max_in_flight, 2)
+        for result in results:
+            self.assertEqual(result, [(url, url.encode('utf-8')) for url in urls])
+
+
+if __name__ == '__main__':
+    unittest.main()
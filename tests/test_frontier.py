@@ -0,0 +1,35 @@
+"""
+This file contains tests of Frontier, order of claimed urls and due of completed urls.
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+
+import unittest
+from utils.frontier import Frontier, DONE, FAILED
+
+
+class TestFrontier(unittest.TestCase):
+
+    def test_claim_by_review_count(self):
+        frontier = Frontier(':memory:')
+        frontier.add([('https://a/', 1), ('https://b/', 30), ('https://c/', 5)], 'Sport')
+        frontier.add([('https://a/', 50)], 'Sport')
+        self.assertEqual(frontier.claim('Sport', 2), ['https://a/', 'https://b/'])
+        self.assertEqual(frontier.claim('Sport', 2), ['https://c/'])
+        self.assertEqual(frontier.claim('Sport', 2), [])
+        frontier.close()
+
+    def test_failed_urls_are_retried(self):
+        frontier = Frontier(':memory:', retry_after=0)
+        frontier.add([('https://a/', 1), ('https://b/', 2)], 'Sport')
+        done, failed = frontier.claim('Sport', 2)
+        frontier.complete([done])
+        frontier.complete([failed], False)
+        self.assertEqual(frontier.get_statistic('Sport'), {DONE: 1, FAILED: 1})
+        # crawled url waits for recrawl period
+        self.assertEqual(frontier.claim('Sport', 2), [failed])
+        frontier.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+"""
+This file contains tests of UrlStore, products of category are streamed by index without sorting.
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+
+import unittest
+from utils.url_store import UrlStore
+
+
+class TestUrlStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = UrlStore(':memory:')
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_iter_products(self):
+        self.store.add('https://a.heureka.cz/x/recenze/', 'Elektronika', 3)
+        self.store.add('https://a.heureka.cz/y/', 'Elektronika', 0)
+        self.store.add('https://b.heureka.cz/z/recenze/', 'Sport', 1)
+        self.store.add('https://a.heureka.cz/w/recenze/', 'Elektronika', 5)
+        self.assertEqual(list(self.store.iter_products('Elektronika', chunk_size=1)),
+                         [('https://a.heureka.cz/x/recenze/', 3), ('https://a.heureka.cz/w/recenze/', 5)])
+        self.assertEqual(list(self.store.iter_products('Elektronika', with_reviews=False)),
+                         [('https://a.heureka.cz/y/', 0)])
+
+    def test_query_plan(self):
+        for with_reviews in (True, False):
+            plan = self.store.db.execute('EXPLAIN QUERY PLAN ' + UrlStore.products_query(with_reviews),
+                                         ('Elektronika', 0, 1000)).fetchall()
+            details = ' '.join(row[-1] for row in plan)
+            self.assertIn('USING INDEX', details)
+            self.assertNotIn('USE TEMP B-TREE', details)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+This file contains implementation of class Checkpoint, which persists progress of crawling of category url file, so
+crawl can be resumed after restart without downloading already crawled products again. Progress is stored as json file
+per category with count of processed lines of url file and names of completed products.
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+import json, os, sys, time
+
+
+class Checkpoint:
+    """
+    Class holds progress of crawling of one category.
+    """
+    def __init__(self, path: str, category: str, interval: float = 60.0):
+        """
+        Initialize empty progress.
+        :param path: directory of checkpoints
+        :param category: domain category
+        :param interval: minimal count of seconds between two saves
+        """
+        self.file = os.path.join(path, category + '.json')
+        self.interval = interval
+        self.line = 0
+        self.products = set()
+        self.saved = time.time()
+        os.makedirs(path, exist_ok=True)
+
+    def load(self):
+        """
+        Load saved progress, progress stays empty if there is no checkpoint.
+        :return: self
+        """
+        try:
+            with open(self.file, 'r') as f:
+                progress = json.load(f)
+            self.line = progress['line']
+            self.products = set(progress['products'])
+            print('[Checkpoint] Resuming {} from line {}'.format(self.file, str(self.line)))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("[Checkpoint-load] Error: " + str(e), file=sys.stderr)
+
+        return self
+
+    def due(self) -> bool:
+        """
+        Check if interval elapsed since the last save.
+        :return:
+        """
+        return time.time() - self.saved >= self.interval
+
+    def save(self, line: int, products: set):
+        """
+        Save progress, documents of completed products needs to be already indexed.
+        :param line: count of processed lines of url file
+        :param products: names of completed products
+        :return:
+        """
+        self.line = line
+        self.products = products
+        try:
+            with open(self.file + '.tmp', 'w') as f:
+                json.dump({'line': line, 'products': list(products)}, f)
+            os.replace(self.file + '.tmp', self.file)
+            self.saved = time.time()
+        except Exception as e:
+            print("[Checkpoint-save] Error: " + str(e), file=sys.stderr)
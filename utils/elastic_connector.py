@@ -8,10 +8,139 @@ Author: xkloco00@stud.fit.vutbr.cz
 from elasticsearch import Elasticsearch
 from elasticsearch.exceptions import NotFoundError
 
-import json, sys
+import json, sys, time, threading
 from anytree import Node
 from anytree.exporter import JsonExporter, DictExporter
 from operator import itemgetter
+from .lru_cache import LRUCache
+
+
+# outcomes of bulk items
+CREATED = 'created'
+DUPLICATE = 'duplicate'
+FAILED = 'failed'
+
+
+class BulkIndexer:
+    """
+    Class buffers documents and indexes them with _bulk endpoint. Buffer is flushed when count of documents, size of
+    buffer or time from last flush exceeds its limit. Outcome of every document is passed to its callback after flush.
+    """
+    def __init__(self, es: Elasticsearch, max_docs: int = 500, max_bytes: int = 5 * 1024 * 1024,
+                 max_interval: float = 10.0):
+        """
+        Initialize empty buffer.
+        :param es: elastic search client
+        :param max_docs: maximal count of buffered documents
+        :param max_bytes: maximal size of buffered request in bytes
+        :param max_interval: maximal time in seconds between flushes
+        """
+        self.es = es
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.max_interval = max_interval
+        self.lock = threading.RLock()
+        self.buffer = []
+        # callbacks of buffered documents in order of buffer
+        self.callbacks = []
+        self.buffer_docs = 0
+        self.buffer_bytes = 0
+        self.last_flush = time.time()
+        # indexes, that were written since last refresh
+        self.indices = set()
+        self.indexed_count = 0
+        # documents with create operation, that already exist
+        self.duplicate_count = 0
+        self.failed_count = 0
+        self.failures = []
+
+    def add(self, index: str, doc: dict, doc_id: str = None, op_type: str = 'index', callback=None) -> list:
+        """
+        Append document to buffer and flush buffer if some limit is exceeded.
+        :param index: name of index
+        :param doc: document
+        :param doc_id: id of document, elastic generates id if it is not given
+        :param op_type: bulk operation index or create, create with existing doc_id is skipped as duplicate
+        :param callback: function called with outcome of document (CREATED, DUPLICATE or FAILED) after flush
+        :return: list of failed items if buffer was flushed
+        """
+        meta = {'_index': index, '_type': 'doc'}
+        if doc_id:
+            meta['_id'] = doc_id
+        action = json.dumps({op_type: meta}, ensure_ascii=False) + '\n' + json.dumps(doc, ensure_ascii=False) + '\n'
+
+        with self.lock:
+            self.buffer.append(action)
+            self.callbacks.append(callback)
+            self.buffer_docs += 1
+            self.buffer_bytes += len(action.encode('utf-8'))
+            self.indices.add(index)
+            if self.buffer_docs >= self.max_docs or self.buffer_bytes >= self.max_bytes or \
+                    time.time() - self.last_flush >= self.max_interval:
+                return self.flush()
+        return []
+
+    def flush(self) -> list:
+        """
+        Send buffered documents to elastic.
+        :return: list of failed items: (index, id, status, error)
+        """
+        with self.lock:
+            self.last_flush = time.time()
+            if not self.buffer:
+                return []
+            body = ''.join(self.buffer)
+            callbacks = self.callbacks
+            self.buffer = []
+            self.callbacks = []
+            self.buffer_docs = 0
+            self.buffer_bytes = 0
+
+            failures = []
+            # documents without item in response are failed
+            outcomes = [FAILED] * len(callbacks)
+            try:
+                res = self.es.bulk(body=body.encode('utf-8'))
+                for i, item in enumerate(res['items'][:len(outcomes)]):
+                    op, result = next(iter(item.items()))
+                    # document with the same id already exists
+                    if op == 'create' and result.get('status') == 409:
+                        outcomes[i] = DUPLICATE
+                    elif result.get('error'):
+                        failures.append((result.get('_index'), result.get('_id'), result.get('status'),
+                                         result['error']))
+                    else:
+                        outcomes[i] = CREATED
+
+            except Exception as e:
+                print("[BulkIndexer-flush] Error: " + str(e), file=sys.stderr)
+                failures.append((None, None, None, str(e)))
+
+            self.indexed_count += outcomes.count(CREATED)
+            self.duplicate_count += outcomes.count(DUPLICATE)
+            self.failed_count += outcomes.count(FAILED)
+            self.failures += failures
+
+            for callback, outcome in zip(callbacks, outcomes):
+                if callback:
+                    try:
+                        callback(outcome)
+                    except Exception as e:
+                        print("[BulkIndexer-flush] Error: callback " + str(e), file=sys.stderr)
+            return failures
+
+    def refresh(self):
+        """
+        Refresh all indexes written since the last refresh.
+        :return:
+        """
+        with self.lock:
+            for index in self.indices:
+                try:
+                    self.es.indices.refresh(index=index)
+                except Exception as e:
+                    print("[BulkIndexer-refresh] Error: " + str(e), file=sys.stderr)
+            self.indices = set()
 
 
 class Connector:
@@ -19,11 +148,12 @@ class Connector:
     Class handles requests to elastic search and provides CRUD operations for products/shops/reviews/users/clustering
     experiments/topics.
     """
-    def __init__(self, host=None, port=None):
+    def __init__(self, host=None, port=None, cache_size: int = 2000000):
         """
         Constructor initializes elastic connection with given host and port information and initializes domains mapping.
         :param host:
         :param port:
+        :param cache_size: maximal count of cached products and shops
         """
         # connect to localhost
         if not host:
@@ -42,6 +172,12 @@ class Connector:
         self.jsonExporter = JsonExporter(indent=2, sort_keys=True, ensure_ascii=False)
         self.dictExporter = DictExporter()
         self.category_to_domain = self.get_product_breadcrums(breadcrumbs=False)
+        self.bulk = BulkIndexer(self.es)
+        # name to document caches, False marks document known only by its name
+        self.product_cache = LRUCache(cache_size)
+        self.shop_cache = LRUCache(cache_size)
+        # product url to category list (breadcrumbs) of product
+        self.category_cache = LRUCache(cache_size)
 
     def index(self, index: str, doc: dict):
         """
@@ -55,12 +191,159 @@ class Connector:
             if res['result'] != 'created':
                 raise Exception('Document was not indexed')
             self.es.indices.refresh(index=index)
+            self.__cache_document(index, doc)
             return res
 
         except Exception as e:
             print("[Connector-index] Error: " + str(e), file=sys.stderr)
             return None
 
+    def bulk_index(self, index: str, doc: dict, doc_id: str = None, op_type: str = 'index', callback=None) -> bool:
+        """
+        Append document doc with index index to bulk buffer, document is indexed with next flush of buffer. Document is
+        cached at once and evicted from cache if it fails.
+        :param index:
+        :param doc:
+        :param doc_id: id of document, elastic generates id if it is not given
+        :param op_type: bulk operation index or create, create with existing doc_id is skipped as duplicate
+        :param callback: function called with outcome of document (CREATED, DUPLICATE or FAILED) after flush
+        :return: True if document was buffered
+        """
+        def _outcome(outcome: str):
+            if outcome == FAILED:
+                self.__uncache_document(index, doc)
+            if callback:
+                callback(outcome)
+
+        try:
+            # document is cached before buffer can be flushed, so its failure evicts it
+            self.__cache_document(index, doc)
+            for _, doc_id_failed, status, error in self.bulk.add(index, doc, doc_id, op_type, _outcome):
+                print("[Connector-bulk_index] Error: {} {} {}".format(str(doc_id_failed), str(status), str(error)),
+                      file=sys.stderr)
+            return True
+
+        except Exception as e:
+            print("[Connector-bulk_index] Error: " + str(e), file=sys.stderr)
+            self.__uncache_document(index, doc)
+            return False
+
+    def flush_bulk(self, refresh: bool = True) -> list:
+        """
+        Index all buffered documents and refresh written indexes.
+        :param refresh: refresh indexes after flush
+        :return: list of failed items: (index, id, status, error)
+        """
+        failures = self.bulk.flush()
+        for _, doc_id, status, error in failures:
+            print("[Connector-flush_bulk] Error: {} {} {}".format(str(doc_id), str(status), str(error)),
+                  file=sys.stderr)
+        if refresh:
+            self.bulk.refresh()
+        return failures
+
+    def get_bulk_failed_count(self) -> int:
+        """
+        Get count of documents, that failed in bulk since connector was created.
+        :return:
+        """
+        with self.bulk.lock:
+            return self.bulk.failed_count
+
+    def __cache_document(self, index: str, doc: dict):
+        """
+        Cache indexed product or shop document by its name.
+        :param index:
+        :param doc:
+        :return:
+        """
+        if index == 'product':
+            self.product_cache.put(doc['product_name'], doc)
+            if doc.get('url') and doc.get('category_list'):
+                self.cache_category_list(doc['url'], doc['category_list'])
+        elif index == 'shop':
+            self.shop_cache.put(doc['name'], doc)
+
+    def __uncache_document(self, index: str, doc: dict):
+        """
+        Evict product or shop document, which was not indexed, from cache.
+        :param index:
+        :param doc:
+        :return:
+        """
+        if index == 'product':
+            self.product_cache.pop(doc['product_name'])
+            if doc.get('url'):
+                self.category_cache.pop(self.__product_url_key(doc['url']))
+        elif index == 'shop':
+            self.shop_cache.pop(doc['name'])
+
+    def warm_cache(self, index: str):
+        """
+        Load names of all products or shops to cache with one scroll.
+        :param index: product or shop
+        :return: count of loaded names
+        """
+        field, cache = ('product_name', self.product_cache) if index == 'product' else ('name', self.shop_cache)
+        count = 0
+        try:
+            for source in self.scroll_sources(index, [field]):
+                name = source.get(field)
+                if name and name not in cache:
+                    cache.put(name, False)
+                    count += 1
+
+        except Exception as e:
+            print("[Connector-warm_cache] Error: " + str(e), file=sys.stderr)
+
+        return count
+
+    @staticmethod
+    def __product_url_key(url: str) -> str:
+        """
+        Normalize product url, so url of product and url of its reviews share the key.
+        :param url: url of product or its reviews
+        :return: string
+        """
+        url = url.strip().rstrip('/')
+        if url.endswith('/recenze'):
+            url = url[:-len('/recenze')].rstrip('/')
+        return url.split('//')[-1]
+
+    def cache_category_list(self, url: str, category_list: str):
+        """
+        Cache category list (breadcrumbs) of product.
+        :param url: url of product or its reviews
+        :param category_list: category list of product document
+        :return:
+        """
+        self.category_cache.put(self.__product_url_key(url), category_list)
+
+    def get_category_list(self, url: str):
+        """
+        Get cached category list of product.
+        :param url: url of product or its reviews
+        :return: category list or None if product is not cached
+        """
+        return self.category_cache.get(self.__product_url_key(url))
+
+    def warm_category_cache(self):
+        """
+        Load category lists of all products with one scroll.
+        :return: count of loaded products
+        """
+        count = 0
+        try:
+            for source in self.scroll_sources('product', ['url', 'category_list']):
+                if source.get('url') and source.get('category_list'):
+                    self.cache_category_list(source['url'], source['category_list'])
+                    count += 1
+
+        except Exception as e:
+            print("[Connector-warm_category_cache] Error: " + str(e), file=sys.stderr)
+
+        return count
+
     def get_count(self, category: str, subcategory=None, body=None):
         """
         Get count of documents (reviews) from index defined by category. If subcategory is specified get count
@@ -175,6 +458,47 @@ class Connector:
         finally:
             return out
 
+    def scroll_sources(self, index: str, fields: list, query: dict = None, size: int = None):
+        """
+        Stream sources of documents from index with scroll, sources are limited to fields. Unlike __scroll, errors are
+        raised, so caller does not get incomplete data.
+        :param index: name of index
+        :param fields: list of source fields
+        :param query: query, default match_all
+        :param size: count of documents per scroll request
+        :return: generator of sources: dict
+        """
+        body = {
+            "query": query if query else {"match_all": {}},
+            "_source": {"includes": fields, "excludes": []},
+            "sort": [{"_doc": {"order": "asc"}}]
+        }
+        data = self.es.search(index=index, scroll='1m', size=size if size else self.max, body=body)
+        sid = data['_scroll_id']
+        try:
+            while data['hits']['hits']:
+                for d in data['hits']['hits']:
+                    yield d['_source']
+                data = self.es.scroll(scroll_id=sid, scroll='1m')
+                sid = data['_scroll_id']
+        finally:
+            try:
+                self.es.clear_scroll(scroll_id=sid)
+            except Exception as e:
+                print("[Connector-scroll_sources] Error: " + str(e), file=sys.stderr)
+
+    def get_index_count(self, index: str):
+        """
+        Get count of documents in index.
+        :param index: name of index
+        :return: count of documents or None
+        """
+        try:
+            return self.es.count(index=index)['count']
+        except Exception as e:
+            print("[get_index_count] Error: " + str(e), file=sys.stderr)
+            return None
+
     def _list_to_tree(self, values: list):
         """
         Transform list of separated strings by '|' to tree structure, mainly for breadcrumbs.
@@ -423,6 +747,71 @@ class Connector:
             print("[get_product_rev_cnt] Error: " + str(e), file=sys.stderr)
             return 0
 
+    def composite_terms(self, index: str, field: str, size: int = 1000):
+        """
+        Stream buckets of composite terms aggregation page by page, buckets are ordered by term. Errors are raised, so
+        caller does not get incomplete data.
+        :param index: name of index or comma separated names of indexes
+        :param field: keyword field
+        :param size: count of buckets per request
+        :return: generator of tuples (term, count of documents)
+        """
+        after = None
+        while True:
+            composite = {"size": size, "sources": [{"term": {"terms": {"field": field}}}]}
+            if after:
+                composite["after"] = after
+            body = {"size": 0, "aggs": {"terms": {"composite": composite}}}
+            res = self.es.search(index=index, body=body)["aggregations"]["terms"]
+            for bucket in res["buckets"]:
+                yield bucket["key"]["term"], bucket["doc_count"]
+            after = res.get("after_key")
+            if not res["buckets"] or not after:
+                break
+
+    def get_products_under_rev_cnt(self, min_rev_count: int, size: int = 1000):
+        """
+        Stream names of products, that have less than min_rev_count reviews in all review indexes. Products and review
+        counts are aggregated on server and merge joined by product name, so products without reviews are included.
+        :param min_rev_count: minimal count of product reviews
+        :param size: count of buckets per request
+        :return: generator of product names
+        """
+        reviews = self.composite_terms(','.join(self.indexes), 'product_name.keyword', size)
+        review = next(reviews, None)
+        for product_name, _ in self.composite_terms('product', 'product_name.keyword', size):
+            # skip reviews of products, that are not in product index
+            while review is not None and review[0] < product_name:
+                review = next(reviews, None)
+            rev_count = review[1] if review is not None and review[0] == product_name else 0
+            if rev_count < min_rev_count:
+                yield product_name
+
+    def get_products_by_names(self, product_names: list) -> list:
+        """
+        Get product documents by their names with one query.
+        :param product_names: list of product names
+        :return: list of documents, unknown products are missing
+        """
+        try:
+            body = {
+                "size": len(product_names),
+                "query": {
+                    "terms": {
+                        "product_name.keyword": product_names
+                    }
+                }
+            }
+            res = self.es.search(index='product', body=body)
+            products = [hit["_source"] for hit in res["hits"]["hits"]]
+            for product in products:
+                self.product_cache.put(product['product_name'], product)
+            return products
+
+        except Exception as e:
+            print("[get_products_by_names] Error: " + str(e), file=sys.stderr)
+            return []
+
     def get_category_products(self, category: str):
         """
         Get products from given category and metadata about count of products and reviews.
@@ -874,10 +1263,14 @@ class Connector:
 
     def get_product_by_name(self, product_name: str):
         """
-        Get products document by its name.
+        Get products document by its name. Cached document is returned without query, product loaded to cache with
+        warm_cache is returned only with its name.
         :param product_name: the name of product
         :return: document representing product: dict
         """
+        doc = self.product_cache.get(product_name)
+        if doc is not None:
+            return doc if doc else {'product_name': product_name}
         try:
             index = "product"
             body = {
@@ -887,7 +1280,9 @@ class Connector:
             res = self.es.search(index=index, body=body)
             # just one
             if res["hits"]["hits"]:
-                return res["hits"]["hits"][0]["_source"]
+                doc = res["hits"]["hits"][0]["_source"]
+                self.product_cache.put(product_name, doc)
+                return doc
             else:
                 return None
         except Exception as e:
@@ -896,10 +1291,14 @@ class Connector:
 
     def get_shop_by_name(self, shop_name: str):
         """
-        Get shop document by its name.
+        Get shop document by its name. Cached document is returned without query, shop loaded to cache with
+        warm_cache is returned only with its name.
         :param shop_name: the name of shop
         :return: document representing shop: dict
         """
+        doc = self.shop_cache.get(shop_name)
+        if doc is not None:
+            return doc if doc else {'name': shop_name}
         try:
             index = "shop"
             body = {
@@ -909,7 +1308,9 @@ class Connector:
             res = self.es.search(index=index, body=body)
             # just one
             if res["hits"]["hits"]:
-                return res["hits"]["hits"][0]["_source"]
+                doc = res["hits"]["hits"][0]["_source"]
+                self.shop_cache.put(shop_name, doc)
+                return doc
             else:
                 return None
         except Exception as e:
@@ -1502,6 +1903,35 @@ class Connector:
             print("[get_user_by_name] Error: " + str(e), file=sys.stderr)
             return None
 
+    def get_actualization_watermarks(self, category_name: str) -> dict:
+        """
+        Get watermarks of subcategories from the latest actualization statistic of domain category.
+        :param category_name: domain category
+        :return: dict of subcategory url to watermark (review identity and date of the newest review), empty if
+        category was not actualized with watermarks yet
+        """
+        try:
+            body = {
+                "size": 1,
+                "query": {
+                    "bool": {
+                        "must": [
+                            {"term": {"category.keyword": {"value": category_name}}},
+                            {"exists": {"field": "watermarks"}}
+                        ]
+                    }
+                },
+                "sort": [{"timestamp": {"order": "desc", "unmapped_type": "double"}}]
+            }
+            res = self.es.search(index='actualize_statistic', body=body)
+            if not res["hits"]["hits"]:
+                return {}
+            return {w['url']: w for w in res["hits"]["hits"][0]["_source"]["watermarks"]}
+
+        except Exception as e:
+            print("[get_actualization_watermarks] Error: " + str(e), file=sys.stderr)
+            return {}
+
     def get_actualization_by_category(self, category_name: str):
         """
         Get actualization statistics from domain category.
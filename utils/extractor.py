@@ -0,0 +1,251 @@
+"""
+This file contains functions for fast extraction of data from heureka pages. Pages are parsed directly from downloaded
+bytes with lxml and only needed elements (reviews, breadcrumbs, pagination, listings) are selected with precompiled
+XPath expressions. Functions return plain records (dicts, lists, strings), so no parsed tree is kept after extraction.
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+import threading
+from lxml import etree, html
+
+# heureka serves pages in utf-8, lxml parsers can not be shared by threads
+_parsers = threading.local()
+
+
+def _cls(*names) -> str:
+    """
+    Get XPath predicate matching element with all given classes.
+    :param names: class names
+    :return: string
+    """
+    return ' and '.join("contains(concat(' ', normalize-space(@class), ' '), ' {} ')".format(name) for name in names)
+
+
+def _xpath(path: str):
+    return etree.XPath(path, smart_strings=False)
+
+
+# product reviews
+_REVIEW_LIST = _xpath('//*[{}]'.format(_cls('product-review-list')))
+_REVIEWS = _xpath('.//*[{}]'.format(_cls('review')))
+_REVIEW_AUTHOR = _xpath('(.//strong)[1]')
+_REVIEW_DATE = _xpath('(.//*[{}])[1]'.format(_cls('date')))
+_REVIEW_TEXT = _xpath('(.//*[{}])[1]'.format(_cls('revtext')))
+_REVIEW_RATING = _xpath('(.//*[{}])[1]'.format(_cls('hidden')))
+_REVIEW_RECOMMEND_YES = _xpath('.//*[{}]'.format(_cls('recommend-yes')))
+_REVIEW_RECOMMEND_NO = _xpath('.//*[{}]'.format(_cls('recommend-no')))
+_REVIEW_PROS = _xpath('(.//*[{}])[1]//li'.format(_cls('plus')))
+_REVIEW_CONS = _xpath('(.//*[{}])[1]//li'.format(_cls('minus')))
+_REVIEW_SUMMARY = _xpath('(.//p)[1]')
+_REVIEW_PRODUCT = _xpath('(.//h4)[1]')
+_REVIEW_PRODUCT_URL = _xpath('(.//a)[1]/@href')
+
+# product page
+_PRODUCT_NAME = _xpath('(//*[{}])[1]'.format(_cls('item')))
+_BREADCRUMBS = _xpath('//*[@id="breadcrumbs"]//a')
+
+# shop reviews
+_SHOP_REVIEWS = _xpath('//*[{}]'.format(_cls('c-post')))
+_SHOP_SUMMARY = _xpath('(.//*[{}])[1]'.format(_cls('c-post__summary')))
+_SHOP_AUTHOR = _xpath('(.//*[{}])[1]'.format(_cls('c-post__author')))
+_SHOP_RATING = _xpath('(.//*[{}])[1]'.format(_cls('c-rating-widget__value')))
+_SHOP_PROS = _xpath('(.//*[{}])[1]//li'.format(_cls('c-attributes-list--pros')))
+_SHOP_CONS = _xpath('(.//*[{}])[1]//li'.format(_cls('c-attributes-list--cons')))
+_SHOP_DELIVERY_TIME = _xpath('(.//*[{}])[1]'.format(_cls('c-post__delivery-time')))
+_SHOP_PUBLISH_TIME = _xpath('(.//*[{}])[1]/@datetime'.format(_cls('c-post__publish-time')))
+_SHOP_RECOMMENDS = _xpath('.//*[{}]'.format(_cls('u-color-success')))
+_SHOP_NEXT_PAGE = _xpath('(//*[{}]//*[{}])[1]/@href'.format(_cls('c-pagination'), _cls('c-pagination__button')))
+
+# category listings
+_LISTING_PRODUCTS = _xpath('//*[{}]'.format(_cls('rw')))
+_LISTING_URL = _xpath('(.//a)[1]/@href')
+_LISTING_REVIEW_COUNT = _xpath('(.//*[{}])[1]'.format(_cls('review-count')))
+_FASHION_PRODUCTS = _xpath('//*[{}]'.format(_cls('p')))
+_FASHION_PRODUCT_URL = _xpath('(.//*[{}]//a)[1]/@href'.format(_cls('image')))
+_FASHION_REVIEW_COUNT = _xpath('(//*[{}]//span)[1]'.format(_cls('review-count', 'delimiter-blank')))
+
+
+def _text(elements: list) -> str:
+    """
+    Get text of the first element.
+    :param elements: result of XPath
+    :return: text or None if there is no element
+    """
+    return str(elements[0].text_content()) if elements else None
+
+
+def _first(values: list) -> str:
+    return values[0] if values else None
+
+
+def parse_html(content: bytes):
+    """
+    Parse downloaded page.
+    :param content: content of page
+    :return: root element of lxml tree
+    """
+    if isinstance(content, str):
+        return html.document_fromstring(content)
+    parser = getattr(_parsers, 'parser', None)
+    if parser is None:
+        parser = _parsers.parser = html.HTMLParser(encoding='utf-8')
+    return html.document_fromstring(content, parser=parser)
+
+
+def extract_next_page(root, container: str = 'pag bot') -> str:
+    """
+    Get reference to the next page from pagination.
+    :param root: root element or element containing pagination
+    :param container: classes of pagination element
+    :return: reference or None if page is the last one
+    """
+    path = '(.//*[{}]//a[{}])[1]/@href'.format(_cls(*container.split()), _cls('next'))
+    return _first(root.xpath(path, smart_strings=False))
+
+
+def extract_breadcrumbs(root) -> list:
+    """
+    Get texts of breadcrumbs links.
+    :param root: root element
+    :return: list of strings
+    """
+    return [str(a.text_content()) for a in _BREADCRUMBS(root)]
+
+
+def extract_review(review) -> dict:
+    """
+    Get record of product review.
+    :param review: element of review
+    :return: dict with author, date, rating, recommends, pros, cons, summary and product_name, product_url if review
+    holds reference to its product (top reviews of subcategory)
+    """
+    review_text = _REVIEW_TEXT(review)
+    review_text = review_text[0] if review_text else review
+
+    rating = _text(_REVIEW_RATING(review_text))
+    recommends = None
+    if _REVIEW_RECOMMEND_YES(review_text):
+        recommends = 'YES'
+    elif _REVIEW_RECOMMEND_NO(review_text):
+        recommends = 'NO'
+
+    author = _text(_REVIEW_AUTHOR(review))
+    record = {
+        'author': author.strip() if author is not None else 'Anonym',
+        'date': _text(_REVIEW_DATE(review)),
+        'rating': rating.replace("Hodnocení produktu: ", "") if rating else None,
+        'recommends': recommends,
+        'pros': [str(li.text_content()) for li in _REVIEW_PROS(review_text)],
+        'cons': [str(li.text_content()) for li in _REVIEW_CONS(review_text)],
+        'summary': _text(_REVIEW_SUMMARY(review_text)),
+    }
+
+    product = _REVIEW_PRODUCT(review)
+    if product:
+        record['product_name'] = str(product[0].text_content())
+        record['product_url'] = _first(_REVIEW_PRODUCT_URL(product[0]))
+
+    return record
+
+
+def extract_reviews(root) -> list:
+    """
+    Get records of all product reviews on page.
+    :param root: root element
+    :return: list of dicts
+    """
+    return [extract_review(review) for review in _REVIEWS(root)]
+
+
+def extract_product(root) -> dict:
+    """
+    Get record of product review page.
+    :param root: root element
+    :return: dict with name (None if page has no product), category (breadcrumbs without the last one), reviews and
+    reference to next_page
+    """
+    name = _text(_PRODUCT_NAME(root))
+    review_list = _REVIEW_LIST(root)
+    return {
+        'name': name.strip() if name is not None else None,
+        'category': extract_breadcrumbs(root)[:-1],
+        'reviews': [extract_review(review) for review in _REVIEWS(review_list[0])] if review_list else [],
+        'next_page': extract_next_page(review_list[0]) if review_list else None,
+    }
+
+
+def extract_shop_reviews(root) -> list:
+    """
+    Get records of all shop reviews on page.
+    :param root: root element
+    :return: list of dicts with author, datetime, summary, rating, pros, cons, delivery_time and recommends
+    """
+    reviews = []
+    for review in _SHOP_REVIEWS(root):
+        summary = _text(_SHOP_SUMMARY(review))
+        reviews.append({
+            'author': _text(_SHOP_AUTHOR(review)),
+            'datetime': _first(_SHOP_PUBLISH_TIME(review)),
+            'summary': summary.strip() if summary else '',
+            'rating': _text(_SHOP_RATING(review)),
+            'pros': [str(li.text_content()).strip() for li in _SHOP_PROS(review)],
+            'cons': [str(li.text_content()).strip() for li in _SHOP_CONS(review)],
+            'delivery_time': _text(_SHOP_DELIVERY_TIME(review)),
+            'recommends': bool(_SHOP_RECOMMENDS(review)),
+        })
+    return reviews
+
+
+def extract_shop_next_page(root) -> str:
+    """
+    Get reference to the next page of shop reviews.
+    :param root: root element
+    :return: reference or None
+    """
+    return _first(_SHOP_NEXT_PAGE(root))
+
+
+def extract_categories(root, container: str) -> list:
+    """
+    Get urls of subcategories from category list, only categories with reviews (strong element) are returned.
+    :param root: root element
+    :param container: class of category list
+    :return: list of urls
+    """
+    path = './/*[{}]//li[.//strong]'.format(_cls(container))
+    return [_first(_LISTING_URL(li)) for li in root.xpath(path)]
+
+
+def extract_listing(root) -> list:
+    """
+    Get records of products of category listing.
+    :param root: root element
+    :return: list of dicts with url of product, review_url and text of review_count (None if product has no reviews)
+    """
+    products = []
+    for product in _LISTING_PRODUCTS(root):
+        review_count = _LISTING_REVIEW_COUNT(product)
+        products.append({
+            'url': _first(_LISTING_URL(product)),
+            'review_url': _first(_LISTING_URL(review_count[0])) if review_count else None,
+            'review_count': str(review_count[0].text_content()) if review_count else None,
+        })
+    return products
+
+
+def extract_fashion_products(root) -> list:
+    """
+    Get urls of products of fashion category listing.
+    :param root: root element
+    :return: list of urls
+    """
+    return [_first(_FASHION_PRODUCT_URL(product)) for product in _FASHION_PRODUCTS(root)]
+
+
+def extract_fashion_review_count(root) -> str:
+    """
+    Get text of review count of fashion product page.
+    :param root: root element
+    :return: text or None if product has no reviews
+    """
+    return _text(_FASHION_REVIEW_COUNT(root))
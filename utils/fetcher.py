@@ -0,0 +1,195 @@
+"""
+This file contains implementation of class Fetcher, which downloads pages from heureka concurrently. Downloads are
+driven by asyncio event loop, blocking requests are executed in thread pool. Count of running requests is limited
+globally and per host (heureka subdomain), so crawler can overlap hundreds of requests without flooding one domain. Limits
+of hosts are shared by all threads, that download with the same fetcher.
+Rate of requests to host is adapted by RateLimiter and throttled or failed requests are retried with exponential
+backoff.
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+import asyncio, sys, time, threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from .http_session import HttpSession
+from .rate_limiter import RateLimiter, is_throttled, retry_delay
+from .metrics import Metrics
+
+# seconds between attempts of concurrent download to acquire limit of host, which is held by other thread
+_HOST_POLL = 0.01
+
+
+def batches(iterable, size: int):
+    """
+    Split iterable to lists with maximal length of size.
+    :param iterable:
+    :param size: maximal length of batch
+    :return: generator of lists
+    """
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+class Fetcher:
+    """
+    Class handles concurrent downloading of pages with global and per host limits of concurrent requests.
+    """
+    def __init__(self, max_concurrency: int = 64, host_concurrency: int = 8, host_limits: dict = None,
+                 session: HttpSession = None, rate_limiter: RateLimiter = None, max_retries: int = 3,
+                 backoff: float = 1.0, metrics: Metrics = None):
+        """
+        Constructor initializes thread pool for blocking requests and limits of concurrency.
+        :param max_concurrency: maximal count of all running requests
+        :param host_concurrency: default maximal count of running requests to one host
+        :param host_limits: dictionary of host name (f.e. elektronika.heureka.cz) to its maximal count of requests
+        :param session: shared http session with pooled connections
+        :param rate_limiter: adaptive limiter of requests per second to host, None does not limit rate
+        :param max_retries: maximal count of retries of throttled or failed request
+        :param backoff: delay before the first retry in seconds, delay doubles with every retry
+        :param metrics: registry of metrics, which receives latency of requests and counts of failures and retries
+        """
+        self.metrics = metrics if metrics else Metrics()
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = session if session else HttpSession(pool_maxsize=host_concurrency)
+        self.max_concurrency = max_concurrency
+        self.host_concurrency = host_concurrency
+        self.host_limits = host_limits if host_limits else {}
+        # host name to semaphore of its running requests
+        self.host_semaphores = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    def get_host_limit(self, host: str) -> int:
+        """
+        Get maximal count of concurrent requests to host.
+        :param host: host name
+        :return:
+        """
+        return self.host_limits.get(host, self.host_concurrency)
+
+    def get_host_semaphore(self, host: str) -> threading.BoundedSemaphore:
+        """
+        Get semaphore limiting concurrent requests to host, semaphore is created with the first request to host.
+        :param host: host name
+        :return:
+        """
+        with self.lock:
+            if host not in self.host_semaphores:
+                self.host_semaphores[host] = threading.BoundedSemaphore(self.get_host_limit(host))
+            return self.host_semaphores[host]
+
+    def get(self, url: str) -> bytes:
+        """
+        Download content of url. Method blocks until the whole page is downloaded.
+        :param url:
+        :return: content of page
+        """
+        return self.session.get(url)
+
+    def request(self, url: str, get=None) -> bytes:
+        """
+        Download content of url once, request waits for rate limiter of host and its response adapts the rate.
+        :param url:
+        :param get: blocking function downloading one url, default is get of fetcher
+        :return: content of page
+        """
+        host = urlparse(url).netloc
+        if self.rate_limiter:
+            self.rate_limiter.acquire(host)
+
+        start = time.time()
+        try:
+            content = get(url) if get else self.get(url)
+        except Exception as e:
+            self.metrics.observe('fetch', time.time() - start)
+            self.metrics.inc('fetch_errors')
+            if self.rate_limiter and is_throttled(e):
+                self.rate_limiter.throttle(host)
+            raise
+
+        latency = time.time() - start
+        self.metrics.observe('fetch', latency)
+        if self.rate_limiter:
+            self.rate_limiter.success(host, latency)
+        return content
+
+    def fetch(self, url: str) -> bytes:
+        """
+        Download one page within limit of its host, throttled or failed request is retried. Raises IOError if the page
+        can not be downloaded.
+        :param url:
+        :return: content of page
+        """
+        semaphore = self.get_host_semaphore(urlparse(url).netloc)
+        attempt = 0
+        while True:
+            try:
+                with semaphore:
+                    return self.request(url)
+            except Exception as e:
+                delay = retry_delay(e, attempt, self.backoff) if attempt < self.max_retries else None
+                if delay is None:
+                    raise
+                attempt += 1
+                self.metrics.inc('fetch_retries')
+                time.sleep(delay)
+
+    def fetch_all(self, urls: list, get=None) -> list:
+        """
+        Download all urls concurrently.
+        :param urls: list of urls
+        :param get: blocking function downloading one url (f.e. HttpCache.get), default is get of fetcher
+        :return: list of tuples (url, content) in order of urls, content is None if page could not be downloaded
+        """
+        if not urls:
+            return []
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.__fetch_all(urls, loop, get))
+        finally:
+            loop.close()
+
+    async def __fetch_all(self, urls: list, loop, get):
+        """
+        Schedule download of urls to event loop.
+        :param urls: list of urls
+        :param loop: running event loop
+        :param get: blocking function downloading one url, None for get of fetcher
+        :return: list of tuples (url, content)
+        """
+        # semaphore needs to be created in running loop
+        global_semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def _fetch(url: str):
+            host_semaphore = self.get_host_semaphore(urlparse(url).netloc)
+            attempt = 0
+            while True:
+                # limit of host is shared with other threads, so it is not awaited in thread of pool
+                while not host_semaphore.acquire(blocking=False):
+                    await asyncio.sleep(_HOST_POLL)
+                try:
+                    async with global_semaphore:
+                        content = await loop.run_in_executor(self.executor, self.request, url, get)
+                        return url, content
+                except Exception as e:
+                    error = e
+                finally:
+                    host_semaphore.release()
+
+                # retry is deferred without holding limits of concurrency
+                delay = retry_delay(error, attempt, self.backoff) if attempt < self.max_retries else None
+                if delay is None:
+                    print("[Fetcher] Cant open " + url + " " + str(error), file=sys.stderr)
+                    return url, None
+                attempt += 1
+                self.metrics.inc('fetch_retries')
+                await asyncio.sleep(delay)
+
+        return await asyncio.gather(*[_fetch(url) for url in urls])
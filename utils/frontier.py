@@ -0,0 +1,142 @@
+"""
+This file contains implementation of class Frontier, which is persistent store of product urls for crawling backed by
+sqlite. Urls are deduplicated, every url holds its category, count of reviews from category listing, status, time of
+the last crawl and time from which it can be claimed (due). Crawl workers claim urls in order of due and count of
+reviews and mark them completed: never crawled urls are first (by count of reviews), crawled urls are due after recrawl
+period, failed urls after short retry period and claims of crashed workers are due after they expire. Due and count of
+reviews are indexed with category, so claim reads only claimed rows.
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+import sqlite3, threading, time
+
+# statuses of url
+NEW = 'new'
+CLAIMED = 'claimed'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Frontier:
+    """
+    Class represents prioritized crawl frontier of product urls.
+    """
+    def __init__(self, path: str, recrawl_after: float = 7 * 24 * 3600, claim_timeout: float = 3600,
+                 retry_after: float = 600):
+        """
+        Open (or create) frontier database.
+        :param path: path to sqlite database
+        :param recrawl_after: count of seconds after which crawled url can be claimed again
+        :param claim_timeout: count of seconds after which claim of url expires
+        :param retry_after: count of seconds after which failed url can be claimed again
+        """
+        self.recrawl_after = recrawl_after
+        self.claim_timeout = claim_timeout
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        # frontier can be shared by processes, sqlite locks database for writing
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self.db.execute('CREATE TABLE IF NOT EXISTS url (url TEXT PRIMARY KEY, category TEXT, review_count INTEGER, '
+                        'status TEXT, last_crawl REAL, claimed REAL, due REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS url_category ON url (category, status)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS url_claim ON url (category, due, review_count DESC)')
+
+    def add(self, urls: list, category: str):
+        """
+        Add urls to frontier, known urls keep their status and only their count of reviews is raised. New urls are due
+        before any crawled url.
+        :param urls: list of tuples (url, count of reviews)
+        :param category: domain category
+        :return:
+        """
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                self.db.executemany('INSERT OR IGNORE INTO url (url, category, review_count, status, due) '
+                                    'VALUES (?, ?, 0, ?, 0)', [(url, category, NEW) for url, _ in urls])
+                self.db.executemany('UPDATE url SET review_count = MAX(review_count, ?) WHERE url = ?',
+                                    [(review_count, url) for url, review_count in urls])
+                self.db.execute('COMMIT')
+            except Exception:
+                self.db.execute('ROLLBACK')
+                raise
+
+    def claim(self, category: str, count: int) -> list:
+        """
+        Atomically claim due urls of category in order of due, urls with the same due by count of reviews. Url is due
+        if it is new, if it was crawled before recrawl_after seconds, if it failed before retry_after seconds or if its
+        claim expired.
+        :param category: domain category
+        :param count: maximal count of claimed urls
+        :return: list of urls
+        """
+        now = time.time()
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                # range of index url_claim, never crawled urls are first, crawled ones by age of crawl
+                rows = self.db.execute('SELECT url FROM url WHERE category = ? AND due <= ? '
+                                       'ORDER BY due, review_count DESC LIMIT ?', (category, now, count)).fetchall()
+                urls = [row[0] for row in rows]
+                self.db.executemany('UPDATE url SET status = ?, claimed = ?, due = ? WHERE url = ?',
+                                    [(CLAIMED, now, now + self.claim_timeout, url) for url in urls])
+                self.db.execute('COMMIT')
+            except Exception:
+                self.db.execute('ROLLBACK')
+                raise
+
+        return urls
+
+    def complete(self, urls: list, success: bool = True):
+        """
+        Mark claimed urls as crawled, crawled urls are due after recrawl_after seconds, failed ones after retry_after
+        seconds.
+        :param urls: list of urls
+        :param success: urls were crawled successfully, else they are marked as failed
+        :return:
+        """
+        now = time.time()
+        status, due = (DONE, now + self.recrawl_after) if success else (FAILED, now + self.retry_after)
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                self.db.executemany('UPDATE url SET status = ?, last_crawl = ?, claimed = NULL, due = ? WHERE url = ?',
+                                    [(status, now, due, url) for url in urls])
+                self.db.execute('COMMIT')
+            except Exception:
+                self.db.execute('ROLLBACK')
+                raise
+
+    def import_file(self, path: str, category: str) -> int:
+        """
+        Add urls from url file of HeurekaIndex, count of reviews is not known.
+        :param path: path to url file
+        :param category: domain category
+        :return: count of read urls
+        """
+        urls = []
+        with open(path, 'r') as url_file:
+            for line in url_file:
+                url = line.strip()
+                if url:
+                    urls.append((url, 0))
+        self.add(urls, category)
+        return len(urls)
+
+    def get_statistic(self, category: str) -> dict:
+        """
+        Get count of urls of category by status.
+        :param category: domain category
+        :return: dict
+        """
+        with self.lock:
+            rows = self.db.execute('SELECT status, COUNT(*) FROM url WHERE category = ? GROUP BY status',
+                                   (category,)).fetchall()
+        return dict(rows)
+
+    def close(self):
+        """
+        Close frontier database.
+        :return:
+        """
+        self.db.close()
@@ -0,0 +1,84 @@
+"""
+This file contains implementation of class HttpCache, which is on disk cache of validators of pages (ETag,
+Last-Modified and hash of content). Cache is used during actualization of reviews, where pages are downloaded with
+conditional requests, so page that was not modified since the last actualization is not parsed at all.
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+import sqlite3, threading
+from hashlib import sha1
+from .http_session import HttpSession
+
+# sentinel returned instead of content for page, which was not modified since the last download, empty page is
+# a content
+NOT_MODIFIED = object()
+
+
+class HttpCache:
+    """
+    Class holds validators of downloaded pages in sqlite database. Validators of new content are kept pending until
+    commit, so page is skipped next time only if its reviews were indexed.
+    """
+    def __init__(self, path: str, session: HttpSession = None):
+        """
+        Open (or create) cache database.
+        :param path: path to sqlite database
+        :param session: http session used for downloading
+        """
+        self.session = session if session else HttpSession()
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS page (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, '
+                        'body_hash TEXT)')
+        self.db.commit()
+
+    def get(self, url: str) -> bytes:
+        """
+        Download content of url with conditional request. Raises IOError if the page can not be downloaded.
+        :param url:
+        :return: content of page or NOT_MODIFIED if page returned 304 or its content has the same hash
+        """
+        with self.lock:
+            row = self.db.execute('SELECT etag, last_modified, body_hash FROM page WHERE url = ?',
+                                  (url,)).fetchone()
+        etag, last_modified, body_hash = row if row else (None, None, None)
+
+        content, etag, last_modified = self.session.get_conditional(url, etag, last_modified)
+        if content is None:
+            return NOT_MODIFIED
+
+        content_hash = sha1(content).hexdigest()
+        if content_hash == body_hash:
+            return NOT_MODIFIED
+
+        with self.lock:
+            self.pending[url] = (etag, last_modified, content_hash)
+        return content
+
+    def commit(self):
+        """
+        Save validators of all pages downloaded since the last commit.
+        :return:
+        """
+        with self.lock:
+            self.db.executemany('INSERT OR REPLACE INTO page (url, etag, last_modified, body_hash) VALUES (?, ?, ?, ?)',
+                                [(url,) + validators for url, validators in self.pending.items()])
+            self.db.commit()
+            self.pending = {}
+
+    def discard(self):
+        """
+        Discard validators of all pages downloaded since the last commit, so pages are downloaded and parsed again
+        next time.
+        :return:
+        """
+        with self.lock:
+            self.pending = {}
+
+    def close(self):
+        """
+        Close cache database, pending validators are discarded.
+        :return:
+        """
+        self.db.close()
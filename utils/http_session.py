@@ -0,0 +1,79 @@
+"""
+This file contains implementation of class HttpSession, which is shared by HeurekaCrawler and HeurekaIndex for all
+requests to heureka. Session keeps pool of keep-alive connections for every host, so pages are not downloaded with new
+TCP+TLS handshake each time, and requests compressed content.
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    # brotli decoding is supported by urllib3 only if brotli package is available
+    import brotli
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+
+class HttpSession:
+    """
+    Class wraps requests session with connection pooling, keep-alive connections, compression and timeouts.
+    """
+    def __init__(self, pool_connections: int = 32, pool_maxsize: int = 16, connect_timeout: float = 10.0,
+                 read_timeout: float = 30.0):
+        """
+        Constructor initializes requests session with pooled adapters.
+        :param pool_connections: count of hosts, whose connections are kept in pool
+        :param pool_maxsize: maximal count of kept connections to one host
+        :param connect_timeout: timeout of connection in seconds
+        :param read_timeout: timeout of reading response in seconds
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Accept-Encoding': ACCEPT_ENCODING,
+            'Connection': 'keep-alive',
+        })
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, url: str) -> bytes:
+        """
+        Download content of url, content is decompressed by session. Raises IOError if the page can not be downloaded.
+        :param url:
+        :return: content of page
+        """
+        # crawler appends " " as reference of the first page, requests would quote it to %20
+        response = self.session.get(url.strip(), timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+    def get_conditional(self, url: str, etag: str = None, last_modified: str = None) -> tuple:
+        """
+        Download content of url only if it was modified since response with given validators. Raises IOError if the
+        page can not be downloaded.
+        :param url:
+        :param etag: ETag of the last response
+        :param last_modified: Last-Modified of the last response
+        :return: tuple of content (None if page was not modified), ETag and Last-Modified of response
+        """
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        response = self.session.get(url.strip(), headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return None, etag, last_modified
+        response.raise_for_status()
+        return response.content, response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+    def close(self):
+        """
+        Close all pooled connections.
+        :return:
+        """
+        self.session.close()
@@ -0,0 +1,66 @@
+"""
+This file contains implementation of class LRUCache, thread safe mapping with limited capacity, which evicts least
+recently used items. It is used for caching of documents from elastic during crawling.
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Class represents mapping with limited capacity and least recently used eviction.
+    """
+    def __init__(self, capacity: int):
+        """
+        Initialize empty cache.
+        :param capacity: maximal count of items
+        """
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Get value of key and mark it as recently used.
+        :param key:
+        :param default: value returned if key is not cached
+        :return:
+        """
+        with self.lock:
+            try:
+                self.items.move_to_end(key)
+                return self.items[key]
+            except KeyError:
+                return default
+
+    def put(self, key, value):
+        """
+        Cache value of key, least recently used item is evicted if cache is full.
+        :param key:
+        :param value:
+        :return:
+        """
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            if len(self.items) > self.capacity:
+                self.items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        Remove key from cache.
+        :param key:
+        :param default: value returned if key is not cached
+        :return: removed value
+        """
+        with self.lock:
+            return self.items.pop(key, default)
+
+    def __contains__(self, key) -> bool:
+        with self.lock:
+            return key in self.items
+
+    def __len__(self):
+        return len(self.items)
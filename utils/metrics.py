@@ -0,0 +1,186 @@
+"""
+This file contains implementation of class Metrics, which is registry of counters and latency histograms of crawler
+stages (fetch, parse, tagging, filter, rating, dedup, index). Metrics of run are written in Prometheus text format and as
+json summary, so stage, which bounds throughput of crawl, can be found. Metrics of worker processes are merged through
+snapshots.
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+import json, threading, time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# upper bounds of latency buckets in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    Class holds count of observations in latency buckets, their count and sum.
+    """
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        # the last bucket is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate quantile as upper bound of bucket, which contains it.
+        :param q: quantile (0 - 1)
+        :return: seconds, the last finite bound for +Inf bucket
+        """
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class Metrics:
+    """
+    Class represents thread safe registry of counters and stage histograms.
+    """
+    def __init__(self, prefix: str = 'heureka_crawler', buckets: tuple = BUCKETS):
+        """
+        Initialize empty registry.
+        :param prefix: prefix of names of exported metrics
+        :param buckets: upper bounds of latency buckets in seconds
+        """
+        self.prefix = prefix
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1):
+        """
+        Increase counter.
+        :param name: name of counter
+        :param value:
+        :return:
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, stage: str, seconds: float):
+        """
+        Add latency of stage to its histogram.
+        :param stage: name of stage
+        :param seconds: latency
+        :return:
+        """
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """
+        Measure latency of block of code, latency is observed even if the block raises.
+        :param stage: name of stage
+        :return:
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.time() - start)
+
+    def snapshot(self) -> dict:
+        """
+        Get picklable state of registry.
+        :return: dict with counters and histograms
+        """
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': {stage: {'counts': list(h.counts), 'sum': h.sum, 'count': h.count}
+                               for stage, h in self.histograms.items()}
+            }
+
+    def merge(self, snapshot: dict):
+        """
+        Add snapshot of other registry (f.e. of worker process) with the same buckets.
+        :param snapshot: result of snapshot
+        :return:
+        """
+        with self.lock:
+            for name, value in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for stage, state in snapshot['histograms'].items():
+                histogram = self.histograms.get(stage)
+                if histogram is None:
+                    histogram = self.histograms[stage] = Histogram(self.buckets)
+                histogram.counts = [a + b for a, b in zip(histogram.counts, state['counts'])]
+                histogram.sum += state['sum']
+                histogram.count += state['count']
+
+    def to_prometheus(self) -> str:
+        """
+        Export registry in Prometheus text format, stages share one histogram with label stage.
+        :return: string
+        """
+        lines = []
+        with self.lock:
+            for name in sorted(self.counters):
+                metric = '{}_{}_total'.format(self.prefix, name)
+                lines.append('# TYPE {} counter'.format(metric))
+                lines.append('{} {}'.format(metric, self.counters[name]))
+
+            metric = self.prefix + '_stage_seconds'
+            lines.append('# HELP {} Latency of crawler stages in seconds'.format(metric))
+            lines.append('# TYPE {} histogram'.format(metric))
+            for stage in sorted(self.histograms):
+                histogram = self.histograms[stage]
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append('{}_bucket{{stage="{}",le="{}"}} {}'.format(metric, stage, bound, cumulative))
+                lines.append('{}_sum{{stage="{}"}} {}'.format(metric, stage, histogram.sum))
+                lines.append('{}_count{{stage="{}"}} {}'.format(metric, stage, histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> dict:
+        """
+        Get end of run summary, stages are ordered by total time spent in them.
+        :return: dict
+        """
+        with self.lock:
+            stages = {}
+            for stage, histogram in sorted(self.histograms.items(), key=lambda item: -item[1].sum):
+                stages[stage] = {
+                    'count': histogram.count,
+                    'total_seconds': round(histogram.sum, 3),
+                    'mean_seconds': round(histogram.sum / histogram.count, 4) if histogram.count else 0.0,
+                    'p50_seconds': histogram.quantile(0.5),
+                    'p95_seconds': histogram.quantile(0.95),
+                }
+            return {
+                'elapsed_seconds': round(time.time() - self.started, 3),
+                'counters': dict(self.counters),
+                'stages': stages
+            }
+
+    def write(self, path: str):
+        """
+        Write Prometheus text file <path>.prom and json summary <path>.json.
+        :param path: path without extension
+        :return:
+        """
+        with open(path + '.prom', 'w') as f:
+            f.write(self.to_prometheus())
+        with open(path + '.json', 'w') as f:
+            json.dump(self.summary(), f, indent=2)
@@ -0,0 +1,205 @@
+"""
+This file contains implementation of class PageArchive, which is append-only archive of downloaded pages, and session
+wrappers RecordingSession and ReplaySession. Recording session stores every downloaded page with its url and time of
+download to archive, replay session serves pages from archive without network, so parsing and enrichment of whole crawl
+can be repeated and benchmarked deterministically.
+
+Every process records to its own file in archive directory. File is sequence of gzip members (WARC-like), one member per
+page, which holds json header line (url, time, length) followed by content of page, so file can be read by zcat and
+record interrupted by crash is only skipped.
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+import gzip, json, os, sys, threading, time, zlib
+from .http_session import HttpSession
+
+# size of chunk of compressed file read at once
+CHUNK_SIZE = 1 << 16
+
+
+class PageArchive:
+    """
+    Class represents directory of archive files, pages are either appended (record) or looked up by url (replay).
+    """
+    def __init__(self, path: str, record: bool = False):
+        """
+        Open archive directory, in replay mode all archive files are indexed, the latest record of url wins.
+        :param path: archive directory
+        :param record: open new archive file for appending
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.writer = None
+        self.readers = {}
+        # url -> (archive file, offset of record)
+        self.index = {}
+
+        if record:
+            os.makedirs(path, exist_ok=True)
+            name = '{}_{}.warc.gz'.format(time.strftime('%Y%m%d%H%M%S'), os.getpid())
+            self.writer = open(os.path.join(path, name), 'ab')
+        else:
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.warc.gz'):
+                    self.__index_file(os.path.join(path, name))
+
+    @staticmethod
+    def __read_member(f, buffer: bytes = b''):
+        """
+        Decompress one gzip member from current position of file.
+        :param f: archive file
+        :param buffer: already read compressed data
+        :return: tuple of decompressed data (None if member is incomplete), count of compressed bytes of member and
+        compressed data read after member
+        """
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        data = []
+        consumed = 0
+        while True:
+            if not buffer:
+                buffer = f.read(CHUNK_SIZE)
+                if not buffer:
+                    return None, consumed, b''
+            data.append(decompressor.decompress(buffer))
+            if decompressor.eof:
+                unused = decompressor.unused_data
+                return b''.join(data), consumed + len(buffer) - len(unused), unused
+            consumed += len(buffer)
+            buffer = b''
+
+    @staticmethod
+    def __parse_record(data: bytes) -> tuple:
+        """
+        Split record to header and content.
+        :param data: decompressed member
+        :return: tuple of header dict and content
+        """
+        header, _, content = data.partition(b'\n')
+        return json.loads(header.decode('utf-8')), content
+
+    def __index_file(self, file: str):
+        """
+        Add records of archive file to index.
+        :param file: path to archive file
+        :return:
+        """
+        offset = 0
+        buffer = b''
+        with open(file, 'rb') as f:
+            while True:
+                data, consumed, buffer = self.__read_member(f, buffer)
+                if data is None:
+                    if consumed:
+                        print('[PageArchive] Skipping incomplete record of ' + file, file=sys.stderr)
+                    return
+                try:
+                    header, _ = self.__parse_record(data)
+                    self.index[header['url']] = (file, offset)
+                except Exception as e:
+                    print('[PageArchive-index] Error: ' + file + ' ' + str(e), file=sys.stderr)
+                offset += consumed
+
+    def add(self, url: str, content: bytes):
+        """
+        Append page to archive, record is flushed at once.
+        :param url:
+        :param content: content of page
+        :return:
+        """
+        header = json.dumps({'url': url.strip(), 'time': time.time(), 'length': len(content)}).encode('utf-8')
+        member = gzip.compress(header + b'\n' + content)
+        with self.lock:
+            self.writer.write(member)
+            self.writer.flush()
+
+    def get(self, url: str) -> bytes:
+        """
+        Get archived content of url.
+        :param url:
+        :return: content of page or None if url is not archived
+        """
+        location = self.index.get(url.strip())
+        if location is None:
+            return None
+        file, offset = location
+
+        with self.lock:
+            reader = self.readers.get(file)
+            if reader is None:
+                reader = self.readers[file] = open(file, 'rb')
+            reader.seek(offset)
+            data, _, _ = self.__read_member(reader)
+        return self.__parse_record(data)[1]
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        """
+        Close archive files.
+        :return:
+        """
+        if self.writer:
+            self.writer.close()
+        for reader in self.readers.values():
+            reader.close()
+
+
+class RecordingSession:
+    """
+    Class wraps http session, every downloaded page is appended to archive.
+    """
+    def __init__(self, session: HttpSession, archive: PageArchive):
+        """
+        :param session: http session used for downloading
+        :param archive: archive opened for recording
+        """
+        self.session = session
+        self.archive = archive
+
+    def get(self, url: str) -> bytes:
+        content = self.session.get(url)
+        self.archive.add(url, content)
+        return content
+
+    def get_conditional(self, url: str, etag: str = None, last_modified: str = None) -> tuple:
+        content, etag, last_modified = self.session.get_conditional(url, etag, last_modified)
+        # not modified page has no content to record
+        if content is not None:
+            self.archive.add(url, content)
+        return content, etag, last_modified
+
+    def close(self):
+        self.session.close()
+        self.archive.close()
+
+
+class ReplaySession:
+    """
+    Class serves pages from archive with interface of http session, no request is sent.
+    """
+    def __init__(self, archive: PageArchive):
+        """
+        :param archive: archive opened for replay
+        """
+        self.archive = archive
+
+    def get(self, url: str) -> bytes:
+        """
+        Get archived page. Raises IOError if the page is not archived.
+        :param url:
+        :return: content of page
+        """
+        content = self.archive.get(url)
+        if content is None:
+            raise IOError('Page is not archived: ' + url.strip())
+        return content
+
+    def get_conditional(self, url: str, etag: str = None, last_modified: str = None) -> tuple:
+        """
+        Get archived page, archive holds no validators, so page is compared only by hash of content.
+        """
+        return self.get(url), None, None
+
+    def close(self):
+        self.archive.close()
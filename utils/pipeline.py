@@ -0,0 +1,216 @@
+"""
+This file contains implementation of classes Stage and Pipeline, which are used to run crawling as staged
+producer/consumer pipeline (fetch -> parse -> enrich -> index). Stages are connected with bounded queues, so fast stages
+are blocked by slower ones (backpressure). Stage workers are threads for I/O bound work or processes for CPU bound work.
+Pipeline is aborted if worker process dies (f.e. in its initializer), so other stages are not blocked by its full queue.
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+import sys, threading, queue
+import multiprocessing as mp
+
+# end of stream marker, stage functions never produce None as item
+_STOP = None
+# seconds between checks of abort of pipeline while queue is blocked
+_POLL = 0.5
+
+
+class Aborted(Exception):
+    """
+    Exception raised by blocked queue operation of aborted pipeline.
+    """
+
+
+def _put(q, item, abort):
+    """
+    Put item to bounded queue, wait for free space until pipeline is aborted.
+    :param q: queue
+    :param item:
+    :param abort: event of abort of pipeline
+    :return:
+    """
+    while True:
+        try:
+            return q.put(item, timeout=_POLL)
+        except queue.Full:
+            if abort.is_set():
+                raise Aborted()
+
+
+def _get(q, abort):
+    """
+    Get item from queue, wait for item until pipeline is aborted.
+    :param q: queue
+    :param abort: event of abort of pipeline
+    :return: item
+    """
+    while True:
+        try:
+            return q.get(timeout=_POLL)
+        except queue.Empty:
+            if abort.is_set():
+                raise Aborted()
+
+
+def _worker(name: str, function, initializer, initargs: tuple, in_queue, out_queue, abort):
+    """
+    Worker loop of stage, consumes items from in_queue until end of stream and puts outputs of function to out_queue.
+    :param name: name of stage
+    :param function: function(item) -> list of output items
+    :param initializer: function initializing state of worker (f.e. models in process)
+    :param initargs: arguments of initializer
+    :param in_queue: input queue
+    :param out_queue: output queue
+    :param abort: event of abort of pipeline
+    :return:
+    """
+    if initializer:
+        initializer(*initargs)
+
+    try:
+        while True:
+            item = _get(in_queue, abort)
+            if item is _STOP:
+                break
+            try:
+                for output in function(item) or []:
+                    _put(out_queue, output, abort)
+            except Aborted:
+                raise
+            except Exception as e:
+                print("[Pipeline-" + name + "] Error: " + str(e), file=sys.stderr)
+
+    except Aborted:
+        # process of aborted pipeline does not wait until its buffered items are read
+        if hasattr(out_queue, 'cancel_join_thread'):
+            out_queue.cancel_join_thread()
+
+
+class Stage:
+    """
+    Class represents one stage of pipeline with its own count of workers.
+    """
+    def __init__(self, name: str, function, workers: int = 1, processes: bool = False, initializer=None,
+                 initargs: tuple = (), queue_size: int = 256):
+        """
+        Initialize stage. Function of process stage and its initializer needs to be picklable (module level).
+        :param name: name of stage
+        :param function: function(item) -> list of output items
+        :param workers: count of workers
+        :param processes: use processes instead of threads
+        :param initializer: function initializing state of worker
+        :param initargs: arguments of initializer
+        :param queue_size: maximal count of items waiting in input queue of stage
+        """
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.processes = processes
+        self.initializer = initializer
+        self.initargs = initargs
+        self.queue_size = queue_size
+
+
+class Pipeline:
+    """
+    Class connects stages with bounded queues and runs them concurrently.
+    """
+    def __init__(self, stages: list):
+        """
+        Initialize pipeline from ordered list of stages.
+        :param stages: list of Stage instances
+        """
+        self.stages = stages
+
+    def run(self, items):
+        """
+        Feed items to the first stage and wait until all stages are done. If worker process of some stage dies, pipeline
+        is aborted and outputs collected until abort are returned.
+        :param items: iterable of input items
+        :return: list of outputs of the last stage
+        """
+        abort = mp.Event()
+
+        # queue between stages is shared with processes only if some of its sides is process stage
+        queues = []
+        for i, stage in enumerate(self.stages):
+            shared = stage.processes or (i > 0 and self.stages[i - 1].processes)
+            queues.append(mp.Queue(stage.queue_size) if shared else queue.Queue(stage.queue_size))
+        results = mp.Queue() if self.stages[-1].processes else queue.Queue()
+        queues.append(results)
+
+        # start workers, processes first
+        workers = []
+        for i, stage in sorted(enumerate(self.stages), key=lambda s: not s[1].processes):
+            stage_workers = []
+            for _ in range(stage.workers):
+                args = (stage.name, stage.function, stage.initializer, stage.initargs, queues[i], queues[i + 1],
+                        abort)
+                if stage.processes:
+                    w = mp.Process(target=_worker, args=args, daemon=True)
+                else:
+                    w = threading.Thread(target=_worker, args=args, daemon=True)
+                w.start()
+                stage_workers.append(w)
+            workers.append((i, stage_workers))
+        workers = [w for _, w in sorted(workers, key=lambda w: w[0])]
+
+        def _supervise(i: int):
+            """
+            Wait for all workers of stage i and signal end of stream to the next stage.
+            :param i: index of stage
+            :return:
+            """
+            for w in workers[i]:
+                w.join()
+                if self.stages[i].processes and w.exitcode != 0 and not abort.is_set():
+                    print("[Pipeline] Error: worker of stage {} ended with code {}, pipeline is aborted".format(
+                        self.stages[i].name, str(w.exitcode)), file=sys.stderr)
+                    abort.set()
+            next_workers = self.stages[i + 1].workers if i + 1 < len(self.stages) else 1
+            try:
+                for _ in range(next_workers):
+                    _put(queues[i + 1], _STOP, abort)
+            except Aborted:
+                # results queue is not bounded, so the last stage always ends collecting
+                pass
+
+        supervisors = [threading.Thread(target=_supervise, args=(i,), daemon=True) for i in range(len(self.stages))]
+        for s in supervisors:
+            s.start()
+
+        def _feed():
+            """
+            Put input items to the first stage.
+            :return:
+            """
+            try:
+                for item in items:
+                    _put(queues[0], item, abort)
+                for _ in range(self.stages[0].workers):
+                    _put(queues[0], _STOP, abort)
+            except Aborted:
+                pass
+            except Exception as e:
+                print("[Pipeline] Error: " + str(e), file=sys.stderr)
+                try:
+                    for _ in range(self.stages[0].workers):
+                        _put(queues[0], _STOP, abort)
+                except Aborted:
+                    pass
+
+        feeder = threading.Thread(target=_feed, daemon=True)
+        feeder.start()
+
+        # collect outputs until the last stage ends
+        out = []
+        item = results.get()
+        while item is not _STOP:
+            out.append(item)
+            item = results.get()
+
+        feeder.join()
+        for s in supervisors:
+            s.join()
+
+        return out
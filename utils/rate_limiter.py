@@ -0,0 +1,173 @@
+"""
+This file contains implementation of classes TokenBucket and RateLimiter, which limit rate of requests to every host
+(heureka subdomain). Rate of host adapts to responses: it grows additively while host answers fast and drops
+multiplicatively when host throttles (429), fails (5xx) or slows down. Functions retry_delay and is_throttled decide,
+which failed requests are worth of retry.
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+import threading, time, random
+import requests
+
+
+def is_throttled(error: Exception) -> bool:
+    """
+    Check if error is caused by overloaded host (429, 5xx, connection error or timeout).
+    :param error:
+    :return:
+    """
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else 0
+        return status == 429 or status >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def retry_delay(error: Exception, attempt: int, backoff: float = 1.0):
+    """
+    Get delay before retry of failed request with exponential backoff, Retry-After header of response is respected.
+    :param error: error of request
+    :param attempt: number of failed attempt (from 0)
+    :param backoff: delay after the first failed attempt in seconds
+    :return: delay in seconds or None if request should not be retried
+    """
+    if not is_throttled(error):
+        return None
+
+    delay = backoff * 2 ** attempt
+    response = getattr(error, 'response', None)
+    if response is not None:
+        try:
+            delay = max(delay, float(response.headers.get('Retry-After', 0)))
+        except ValueError:
+            pass
+    # jitter spreads retries of concurrent requests
+    return delay * random.uniform(1.0, 1.5)
+
+
+class TokenBucket:
+    """
+    Class represents token bucket, every request takes one token, tokens are refilled with rate per second.
+    """
+    def __init__(self, rate: float, burst: float):
+        """
+        Initialize full bucket.
+        :param rate: count of tokens per second
+        :param burst: maximal count of tokens
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Take one token, method blocks until token is available.
+        :return:
+        """
+        while True:
+            with self.lock:
+                self.__refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def set_rate(self, rate: float):
+        """
+        Change rate of refilling.
+        :param rate: count of tokens per second
+        :return:
+        """
+        with self.lock:
+            self.__refill()
+            self.rate = rate
+
+
+class RateLimiter:
+    """
+    Class holds token bucket for every host and adapts its rate with additive increase and multiplicative decrease.
+    """
+    def __init__(self, rate: float = 8.0, min_rate: float = 0.5, max_rate: float = 64.0, increase: float = 0.1,
+                 decrease: float = 0.5, latency_target: float = 2.0, cooldown: float = 1.0):
+        """
+        Initialize limiter.
+        :param rate: initial count of requests per second to one host
+        :param min_rate: minimal rate of host
+        :param max_rate: maximal rate of host
+        :param increase: rate added after every fast response
+        :param decrease: rate multiplier after throttled request
+        :param latency_target: response time in seconds, slower responses decrease rate slightly
+        :param cooldown: minimal count of seconds between two decreases of rate, so burst of failed concurrent requests
+        decreases rate only once
+        """
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.buckets = {}
+        self.decreased = {}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, host: str) -> TokenBucket:
+        """
+        Get bucket of host, bucket is created with initial rate.
+        :param host: host name
+        :return:
+        """
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(self.rate, max(1.0, self.rate))
+            return bucket
+
+    def get_rate(self, host: str) -> float:
+        return self.get_bucket(host).rate
+
+    def __update(self, host: str, rate: float):
+        self.get_bucket(host).set_rate(min(self.max_rate, max(self.min_rate, rate)))
+
+    def acquire(self, host: str):
+        """
+        Wait until request to host is allowed.
+        :param host: host name
+        :return:
+        """
+        self.get_bucket(host).acquire()
+
+    def __decrease(self, host: str, factor: float):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.decreased.get(host, 0.0) < self.cooldown:
+                return
+            self.decreased[host] = now
+        self.__update(host, self.get_rate(host) * factor)
+
+    def success(self, host: str, latency: float):
+        """
+        Adapt rate of host to successful response.
+        :param host: host name
+        :param latency: response time in seconds
+        :return:
+        """
+        if latency > self.latency_target:
+            self.__decrease(host, 0.9)
+        else:
+            self.__update(host, self.get_rate(host) + self.increase)
+
+    def throttle(self, host: str):
+        """
+        Adapt rate of host to throttled or failed request.
+        :param host: host name
+        :return:
+        """
+        self.__decrease(host, self.decrease)
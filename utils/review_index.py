@@ -0,0 +1,205 @@
+"""
+This file contains implementation of classes KeySet and ReviewIndex, which are used as local prefilter of duplicate
+reviews. Review is identified by (product_name, author, date_str) or by (shop_name, author, date) for shop reviews.
+Identities of all reviews of index are loaded from elastic with one scroll, stored as 64 bit hashes and persisted to
+disk between runs, so crawler does not need to query elastic for each crawled review. The same identity is used for
+document ids of reviews (review_id).
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+import os, sys, struct, threading
+from array import array
+from bisect import bisect_left
+from hashlib import blake2b, sha1
+
+# fields identifying review in index
+PRODUCT_REVIEW_FIELDS = ['product_name', 'author', 'date_str']
+SHOP_REVIEW_FIELDS = ['shop_name', 'author', 'date']
+
+
+def review_key(*parts) -> int:
+    """
+    Get 64 bit hash of review identity.
+    :param parts: values identifying review
+    :return: int
+    """
+    s = '\x1f'.join(str(p).strip() for p in parts)
+    return int.from_bytes(blake2b(s.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def review_id(index: str, *parts) -> str:
+    """
+    Get stable elastic document id of review from its identity, so indexing of the same review is idempotent.
+    :param index: name of elastic index (domain) of review
+    :param parts: values identifying review (product/shop name, author, date)
+    :return: hex string
+    """
+    s = '\x1f'.join(str(p).strip() for p in (index,) + parts)
+    return sha1(s.encode('utf-8')).hexdigest()
+
+
+class KeySet:
+    """
+    Class represents compact set of 64 bit keys as sorted array with set of newly added keys.
+    """
+    def __init__(self, keys=()):
+        """
+        Initialize set from iterable of keys.
+        :param keys:
+        """
+        self.keys = array('Q', sorted(set(keys)))
+        self.new_keys = set()
+
+    def add(self, key: int):
+        """
+        Add key to set.
+        :param key:
+        :return:
+        """
+        if key not in self:
+            self.new_keys.add(key)
+            # keep new keys small
+            if len(self.new_keys) > 1000000:
+                self.compact()
+
+    def compact(self):
+        """
+        Merge new keys to sorted array.
+        :return:
+        """
+        if self.new_keys:
+            self.keys = array('Q', sorted(set(self.keys) | self.new_keys))
+            self.new_keys = set()
+
+    def __contains__(self, key: int) -> bool:
+        if key in self.new_keys:
+            return True
+        i = bisect_left(self.keys, key)
+        return i < len(self.keys) and self.keys[i] == key
+
+    def __len__(self):
+        return len(self.keys) + len(self.new_keys)
+
+    def save(self, path: str, doc_count: int):
+        """
+        Save keys to file, header of file holds count of documents in index at the time of saving.
+        :param path:
+        :param doc_count: count of documents in index
+        :return:
+        """
+        self.compact()
+        with open(path + '.tmp', 'wb') as f:
+            f.write(struct.pack('<Q', doc_count))
+            self.keys.tofile(f)
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def load(path: str):
+        """
+        Load keys from file.
+        :param path:
+        :return: tuple of KeySet and count of documents in index at the time of saving
+        """
+        key_set = KeySet()
+        with open(path, 'rb') as f:
+            doc_count = struct.unpack('<Q', f.read(8))[0]
+            key_set.keys.frombytes(f.read())
+        return key_set, doc_count
+
+
+class ReviewIndex:
+    """
+    Class holds review identities of elastic indexes. Index is loaded lazily with the first lookup, from file if it is
+    up to date with elastic, else with scroll over elastic index.
+    """
+    def __init__(self, connector, path: str = None):
+        """
+        Initialize empty index.
+        :param connector: Connector instance
+        :param path: directory of persisted indexes, if None indexes are not persisted
+        """
+        self.connector = connector
+        self.path = path
+        self.indexes = {}
+        self.lock = threading.Lock()
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def __file(self, index: str) -> str:
+        """
+        Get path of persisted index.
+        :param index:
+        :return:
+        """
+        return os.path.join(self.path, index + '.keys')
+
+    def load(self, index: str):
+        """
+        Load review identities of elastic index.
+        :param index: name of elastic index
+        :return: KeySet instance
+        """
+        fields = SHOP_REVIEW_FIELDS if index == 'shop_review' else PRODUCT_REVIEW_FIELDS
+        doc_count = self.connector.get_index_count(index)
+
+        # persisted keys are valid only if nothing was indexed since the last save
+        if self.path and os.path.exists(self.__file(index)):
+            try:
+                key_set, saved_count = KeySet.load(self.__file(index))
+                if saved_count == doc_count:
+                    self.indexes[index] = key_set
+                    return key_set
+            except Exception as e:
+                print("[ReviewIndex-load] Error: " + str(e), file=sys.stderr)
+
+        keys = (review_key(*[doc.get(field, '') for field in fields])
+                for doc in self.connector.scroll_sources(index, fields))
+        key_set = KeySet(keys)
+        self.indexes[index] = key_set
+        print('[ReviewIndex] Loaded {} reviews of {}'.format(str(len(key_set)), index))
+        return key_set
+
+    def get(self, index: str) -> KeySet:
+        """
+        Get review identities of elastic index, index is loaded if it is not already.
+        :param index: name of elastic index
+        :return: KeySet instance
+        """
+        key_set = self.indexes.get(index)
+        if key_set is None:
+            with self.lock:
+                key_set = self.indexes.get(index)
+                if key_set is None:
+                    key_set = self.load(index)
+        return key_set
+
+    def contains(self, index: str, *parts) -> bool:
+        """
+        Check if review identified by parts is already in elastic index.
+        :param index: name of elastic index
+        :param parts: values identifying review
+        :return:
+        """
+        return review_key(*parts) in self.get(index)
+
+    def add(self, index: str, *parts):
+        """
+        Add review identified by parts to index.
+        :param index: name of elastic index
+        :param parts: values identifying review
+        :return:
+        """
+        self.get(index).add(review_key(*parts))
+
+    def save(self):
+        """
+        Save all loaded indexes to disk, documents needs to be already indexed and refreshed.
+        :return:
+        """
+        if not self.path:
+            return
+        for index, key_set in self.indexes.items():
+            try:
+                key_set.save(self.__file(index), self.connector.get_index_count(index))
+            except Exception as e:
+                print("[ReviewIndex-save] Error: " + str(e), file=sys.stderr)
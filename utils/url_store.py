@@ -0,0 +1,123 @@
+"""
+This file contains implementation of class UrlStore, which is sqlite store of product urls indexed by HeurekaIndex. Store
+replaces url text files: urls are deduplicated by primary key, so repeated indexing only appends new products, completed
+categories are marked for resume of interrupted indexing and HeurekaCrawler streams urls of domain category in order of
+insertion.
+
+Author: xkloco00@stud.fit.vutbr.cz
+"""
+import sqlite3, threading
+
+
+class UrlStore:
+    """
+    Class represents deduplicated store of product urls of all domain categories.
+    """
+    def __init__(self, path: str, commit_interval: int = 1000):
+        """
+        Open (or create) store database.
+        :param path: path to sqlite database
+        :param commit_interval: count of added urls after which they are committed
+        """
+        self.commit_interval = commit_interval
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS url (id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT UNIQUE, '
+                        'category TEXT, review_count INTEGER)')
+        # products of category with and without reviews are streamed in order of id by separate partial indexes
+        self.db.execute('CREATE INDEX IF NOT EXISTS url_reviews ON url (category, id) WHERE review_count > 0')
+        self.db.execute('CREATE INDEX IF NOT EXISTS url_no_reviews ON url (category, id) WHERE review_count = 0')
+        self.db.execute('CREATE TABLE IF NOT EXISTS done (category TEXT, url TEXT, PRIMARY KEY (category, url))')
+        self.db.commit()
+
+    def add(self, url: str, category: str, review_count: int = 0) -> bool:
+        """
+        Append url, known url is not appended again.
+        :param url: url of product reviews or url of product without reviews
+        :param category: domain category
+        :param review_count: count of reviews of product, 0 for product without reviews
+        :return: True if url was appended
+        """
+        with self.lock:
+            added = self.db.execute('INSERT OR IGNORE INTO url (url, category, review_count) VALUES (?, ?, ?)',
+                                    (url, category, review_count)).rowcount > 0
+            # known product keeps its position, only its count of reviews is updated
+            if not added:
+                self.db.execute('UPDATE url SET review_count = ? WHERE url = ?', (review_count, url))
+            self.pending += 1
+            if self.pending >= self.commit_interval:
+                self.db.commit()
+                self.pending = 0
+        return added
+
+    def __contains__(self, url: str) -> bool:
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM url WHERE url = ?', (url,)).fetchone() is not None
+
+    def iter_products(self, category: str, with_reviews: bool = True, chunk_size: int = 1000):
+        """
+        Stream products of category in order of insertion, products are read in chunks, so no cursor is kept open.
+        :param category: domain category
+        :param with_reviews: products with reviews, else products without reviews
+        :param chunk_size: count of products read at once
+        :return: generator of tuples (url, count of reviews)
+        """
+        last_id = 0
+        while True:
+            with self.lock:
+                rows = self.db.execute(self.products_query(with_reviews), (category, last_id, chunk_size)).fetchall()
+            if not rows:
+                return
+            for last_id, url, review_count in rows:
+                yield url, review_count
+
+    @staticmethod
+    def products_query(with_reviews: bool) -> str:
+        """
+        Get query of chunk of products of category after id, condition of reviews matches one of partial indexes.
+        :param with_reviews: products with reviews, else products without reviews
+        :return: sql query with parameters category, id and limit
+        """
+        return 'SELECT id, url, review_count FROM url WHERE category = ? AND {} AND id > ? ORDER BY id ' \
+               'LIMIT ?'.format('review_count > 0' if with_reviews else 'review_count = 0')
+
+    def mark_done(self, category: str, url: str):
+        """
+        Mark category page url (with all its pages) as indexed.
+        :param category: domain category
+        :param url: url of category
+        :return:
+        """
+        with self.lock:
+            self.db.execute('INSERT OR IGNORE INTO done (category, url) VALUES (?, ?)', (category, url))
+            self.db.commit()
+            self.pending = 0
+
+    def is_done(self, category: str, url: str) -> bool:
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM done WHERE category = ? AND url = ?',
+                                   (category, url)).fetchone() is not None
+
+    def reset_done(self, category: str):
+        """
+        Remove resume markers of domain category, so all its categories are indexed again.
+        :param category: domain category
+        :return:
+        """
+        with self.lock:
+            self.db.execute('DELETE FROM done WHERE category = ?', (category,))
+            self.db.commit()
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+            self.pending = 0
+
+    def close(self):
+        """
+        Commit pending urls and close store database.
+        :return:
+        """
+        self.commit()
+        self.db.close()